@@ -14,6 +14,13 @@ class BaseComponent(object):
 
 
 class AbstractFilter(BaseComponent):
+    """
+    Filters change the document in place. Unless a filter sets `index_aware` and calls
+    doc.reset_index() itself after structural changes, the document's DomIndex is rebuilt
+    after it runs.
+    """
+
+    index_aware = False
 
     def run(self, doc):
         raise NotImplementedError('run method should be overridden')
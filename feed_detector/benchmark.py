@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+
+"""
+Thread scaling benchmark of BaseCoordinator.detect_many().
+
+    python -m feed_detector.benchmark [-t 1,2,4] [-r 3] <html file> ...
+    python -m feed_detector.benchmark --profile DIR [-r 1] <html file> ...
+
+Every file is parsed and detected `repeat` times per thread count; the best wall time of each
+thread count is reported with its speedup over the first one. With --profile, the files are
+run on one thread instead, each stage profiled over the whole corpus (see profiling).
+"""
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import sys
+import time
+
+from optparse import OptionParser
+
+from .coordinator import BaseCoordinator
+from .document    import Document
+from .filter      import BodyRemovalFilter
+from .formatter   import RecordFormatter
+
+
+def bench_threads(sources, thread_counts, repeat=3, config={}):
+    """Returns a list of (threads, best seconds) for detect_many() over `sources`."""
+    coordinator = BaseCoordinator(dict(config, filters=[BodyRemovalFilter],
+                                       formatter=RecordFormatter))
+    coordinator.detect_many(sources[:1], 1)  # warm up lazy imports and parsers
+    rv = []
+    for threads in thread_counts:
+        best = None
+        for i in range(repeat):
+            t = time.time()
+            coordinator.detect_many(sources, threads)
+            t = time.time() - t
+            best = t if best is None else min(best, t)
+        rv.append((threads, best))
+    return rv
+
+
+def bench_profile(sources, repeat=1, config={}):
+    """Runs `sources` sequentially under a StageProfiler and returns it."""
+    from .profiling import ProfilingCoordinator, StageProfiler
+    profiler    = StageProfiler()
+    coordinator = ProfilingCoordinator(dict(config, filters=[BodyRemovalFilter],
+                                            formatter=RecordFormatter, profiler=profiler))
+    for i in range(repeat):
+        for source, url in sources:
+            coordinator.run(profiler.run('parse', Document, source, url=url))
+    return profiler
+
+
+def main():
+    parser = OptionParser(usage="%prog: [options] <html file> ...")
+    parser.add_option('-t', '--threads', default='1,2,4', help="Thread counts [%default]")
+    parser.add_option('-r', '--repeat', type='int', default=3, help="Runs per count [%default]")
+    parser.add_option('-n', '--copies', type='int', default=1,
+                      help="Times each file is queued per run [%default]")
+    parser.add_option('-u', '--url', default='http://localhost/', help="Document url [%default]")
+    parser.add_option('--profile', default=None, metavar='DIR',
+                      help="Profile the stages instead; write pstats and collapsed stacks to DIR")
+    parser.add_option('--top', type='int', default=10,
+                      help="Hot functions printed per stage with --profile [%default]")
+    options, args = parser.parse_args()
+    if not args:
+        parser.print_help()
+        sys.exit(1)
+
+    sources = []
+    for path in args:
+        with open(path, 'rb') as f:
+            sources.append((f.read(), options.url))
+    sources *= options.copies
+
+    if options.profile:
+        profiler = bench_profile(sources, options.repeat)
+        profiler.dump(options.profile)
+        profiler.report(options.top, file=sys.stdout)
+        return
+    thread_counts = [int(x) for x in options.threads.split(',')]
+
+    results = bench_threads(sources, thread_counts, options.repeat)
+    base = results[0][1]
+    print('%d documents' % len(sources))
+    for threads, secs in results:
+        print('%3d threads: %8.3f secs  %7.1f docs/sec  x%.2f' %
+              (threads, secs, len(sources) / secs, base / secs))
+    stats = BodyRemovalFilter.stats.snapshot()
+    print('BodyRemovalFilter skipped %d of %d runs (%.1f%%)' %
+          (stats['skipped'], stats['runs'], stats['skip_rate'] * 100))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import re
+
+
+__all__ = ('ClassInfo', 'class_info')
+
+
+UNLIKELY_CANDIDATES_RE = re.compile(u'combx|comment|community|disqus|extra|foot|header|menu|remark|rss|shoutbox|sidebar|sponsor|ad-break|agegate|pagination|pager|popup|tweet|twitter', re.I)
+MAYBE_CANDIDATE_RE = re.compile(u'and|article|body|column|main|shadow', re.I)
+POSITIVE_RE = re.compile(u'article|pagination|post|text|blog|story', re.I)
+NEGATIVE_RE = re.compile(u'combx|comment|com-|contact|foot|footer|footnote|masthead|media|meta|outbrain|promo|related|scroll|shoutbox|sidebar|sponsor|shopping|tags|tool|widget', re.I)
+
+CACHE_SIZE = 8192
+
+_cache = {}
+
+
+class ClassInfo(object):
+    """
+    What the heuristics want to know about a class or id attribute value: its tokens, the
+    sorted `a.b` label used in full paths, whether it looks like an unlikely (or maybe) content
+    candidate and its class weight. None of the patterns contain a space, so the flags of
+    `"class id"` are the flags of the two values or'ed together.
+    """
+    __slots__ = ('value', 'tokens', 'label', 'unlikely', 'maybe', 'weight')
+
+    def __init__(self, value):
+        self.value    = value
+        self.tokens   = tuple(value.split())
+        self.label    = '.'.join(sorted(self.tokens))
+        self.unlikely = UNLIKELY_CANDIDATES_RE.search(value) is not None
+        self.maybe    = MAYBE_CANDIDATE_RE.search(value) is not None
+        self.weight   = 0
+        if value:
+            if NEGATIVE_RE.search(value):
+                self.weight -= 25
+            if POSITIVE_RE.search(value):
+                self.weight += 25
+
+
+def class_info(value):
+    """
+    Returns the ClassInfo of a class or id value. Pages repeat a few hundred values across
+    thousands of elements, so they are cached per process; like the re module's cache, the
+    cache is simply emptied when it's full.
+    """
+    info = _cache.get(value)
+    if info is None:
+        if len(_cache) >= CACHE_SIZE:
+            _cache.clear()
+        info = _cache[value] = ClassInfo(value)
+    return info
@@ -4,6 +4,7 @@ from __future__ import absolute_import, division, print_function, unicode_litera
 
 from .abstract  import BaseComponent
 from .detector  import Detector
+from .document  import Document
 
 
 __all__ = ('BaseCoordinator',)
@@ -17,6 +18,10 @@ class BaseCoordinator(BaseComponent):
         self._detector  = Detector(config)
         self._formatter = config.get('formatter')(config)
 
+    @property
+    def detector(self):
+        return self._detector
+
     def run(self, doc):
         tmp_doc = doc.copy()
         self.prepare(tmp_doc)
@@ -25,14 +30,33 @@ class BaseCoordinator(BaseComponent):
         groups = self.detect(tmp_doc)
         return self.format(doc, groups)
 
+    def detect_many(self, docs, threads=None):
+        """
+        Runs documents on a thread pool and returns their results in order. Items of `docs` are
+        Documents or (source, url) pairs; the latter are parsed on the pool too, where lxml
+        releases the GIL.
+        """
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(threads) as executor:
+            return list(executor.map(self._run_one, docs))
+
     def prepare(self, doc):
         self._detector.prepare(doc)
 
     def apply_filter(self, doc, f):
-        return f.run(doc)
+        rv = f.run(doc)
+        if not getattr(f, 'index_aware', False):
+            doc.reset_index()
+        return rv
 
     def detect(self, doc):
         return self._detector.run(doc)
 
     def format(self, doc, groups):
         return self._formatter.run(doc, groups)
+
+    def _run_one(self, doc):
+        if not isinstance(doc, Document):
+            source, url = doc
+            doc = Document(source, url=url)
+        return self.run(doc)
@@ -13,7 +13,8 @@ from .compat     import *
 from .util       import *
 
 
-__all__ = ('Entry', 'Path', 'PathBuilder', 'EntryGroup', 'Optimizer', 'Detector')
+__all__ = ('Scoring', 'DEFAULT_SCORING', 'Entry', 'Path', 'PathBuilder', 'EntryGroup', 'Optimizer',
+           'Detector')
 
 
 SHORT_MATCH     = re.compile(r'\A[\u0001-\u02ff]*\Z').match
@@ -44,9 +45,53 @@ TAG_TYPE = dict([(x, k) for k, v in iteritems({
     TAG_WRAPPER: ('li',),
 }) for x in v])
 
-UID_ATTR   = '_fd_uid_'
 INDEX_ATTR = '_fd_index_'
-TABLE_ATTR = '_fd_table_'
+
+
+class Scoring(object):
+    """
+    Scoring parameters of entries, groups and the optimizer. Entry kinds (link, img, deny_url,
+    no_title, label, short) and duplication penalties default to the SCORE_* constants; groups
+    of up to `small_group` entries are dropped, a group's score is divided by
+    `fullpath_scale` * the number of repeated full paths, and scaled by `cbg_decay` (positive
+    scores) or `cbg_growth` (negative ones) per extra context group. The optimizer returns up
+    to `max_groups` groups with a positive score if there are `min_groups` of them, else the
+    best `min_groups` groups.
+    """
+    __slots__ = ('link', 'img', 'deny_url', 'no_title', 'label', 'short',
+                 'dup_url', 'dup_title', 'dup_key', 'small_group', 'fullpath_scale',
+                 'cbg_decay', 'cbg_growth', 'max_groups', 'min_groups')
+
+    DEFAULTS = {
+        'link':           SCORE_LINK,
+        'img':            SCORE_IMG,
+        'deny_url':       SCORE_DENY_URL,
+        'no_title':       SCORE_NO_TITLE,
+        'label':          SCORE_LABEL,
+        'short':          SCORE_SHORT,
+        'dup_url':        SCORE_DUP_URL,
+        'dup_title':      SCORE_DUP_TITLE,
+        'dup_key':        SCORE_DUP_KEY,
+        'small_group':    4,
+        'fullpath_scale': 0.9,
+        'cbg_decay':      0.6,
+        'cbg_growth':     1.5,
+        'max_groups':     8,
+        'min_groups':     4,
+    }
+
+    def __init__(self, **params):
+        unknown = set(params) - set(self.DEFAULTS)
+        if unknown:
+            raise ValueError('unknown scoring parameters: %s' % ', '.join(sorted(unknown)))
+        for k, v in iteritems(dict(self.DEFAULTS, **params)):
+            setattr(self, k, v)
+
+    def to_dict(self):
+        return dict([(x, getattr(self, x)) for x in self.__slots__])
+
+
+DEFAULT_SCORING = Scoring()
 
 
 def cached_property(f):
@@ -60,53 +105,66 @@ def cached_property(f):
     return property(getter)
 
 
-def set_index(parent):
-    for i, el in enumerate(parent, 1):
-        el.set(INDEX_ATTR, str(i))
-        set_index(el)
-    tag = parent.tag
-    if tag == 'td' or tag == 'th':
-        if parent.get('colspan', '') or parent.get('rowspan', ''):
-            el = next(parent.iterancestors('table'), None)
-            if el is not None:
-                el.set(TABLE_ATTR, 'spanned')
-    elif tag == 'ul' or tag == 'ol':
-        align_classes(parent, 'li')
-    elif tag == 'tbody' or tag == 'thead':
-        align_classes(parent, 'tr')
-    elif tag == 'table':
-        align_classes(parent, 'tr')
-        if parent.get(TABLE_ATTR, None) == 'spanned':
-            for el in parent.iterdescendants('td', 'th'):
-                el.attrib.pop(INDEX_ATTR, None)
-
-
-def align_classes(parent, target_tag):
-    it = parent.iterchildren(target_tag)
-    first = next(it, None)
-    if first is not None:
-        classes = set(first.get('class', '').split()).intersection(
-            *[x.get('class', '').split() for x in it])
+def set_index(index):
+    # Cells remember their column so that _build_paths can tell columns apart. Only cells read
+    # it, so other elements aren't annotated.
+    cells = (index.tag_id('td'), index.tag_id('th'))
+    rows  = set([index.parents[x] for x in index.positions('td') + index.positions('th')])
+    for parent in sorted(rows):
+        for i, pos in enumerate(index.children(parent), 1):
+            if index.tags[pos] in cells:
+                index.elements[pos].set(INDEX_ATTR, str(i))
+
+    # Children are handled before their parents, as classes of <li>s and <tr>s are aligned
+    # by their parent.
+    spanned = set()
+    for pos in xrange(len(index) - 1, -1, -1):
+        tag = index.tag(pos)
+        if tag == 'td' or tag == 'th':
+            el = index.elements[pos]
+            if el.get('colspan', '') or el.get('rowspan', ''):
+                table = index.find_ancestor(pos, 'table')
+                if table >= 0:
+                    spanned.add(table)
+        elif tag == 'ul' or tag == 'ol':
+            align_classes(index, pos, 'li')
+        elif tag == 'tbody' or tag == 'thead':
+            align_classes(index, pos, 'tr')
+        elif tag == 'table':
+            align_classes(index, pos, 'tr')
+            if pos in spanned:
+                for x in index.descendants(pos, 'td', 'th'):
+                    index.elements[x].attrib.pop(INDEX_ATTR, None)
+
+
+def align_classes(index, parent, target_tag):
+    tid = index.tag_id(target_tag)
+    targets = [x for x in index.children(parent) if index.tags[x] == tid]
+    if targets:
+        classes = set(index.class_name(targets[0]).split()).intersection(
+            *[index.class_name(x).split() for x in targets[1:]])
         classes = ' '.join([x for x in classes if x])
-        for x in parent.iterchildren(target_tag):
-            x.set('class', classes)
+        for x in targets:
+            index.set_class(x, classes)
 
 
 class Entry(object):
-    __slots__ = ('score', 'cbg_id', 'element', 'url', 'title', 'paths', 'fullpath')
+    __slots__ = ('score', 'kind', 'cbg_id', 'pos', 'element', 'url', 'title', 'paths', 'fullpath')
 
-    def __init__(self, element, cbg_id, wrappers):
-        self.score    = SCORE_LINK
+    def __init__(self, index, pos, cbg_id, wrappers, resolve_url, scoring=DEFAULT_SCORING):
+        element = index.elements[pos]
+        self.kind     = 'link'
         self.cbg_id   = cbg_id
+        self.pos      = pos
         self.element  = element
         self.title    = ((element.text_content() or u'').strip() or
                          (element.get('title') or '').strip())
-        self.url      = (element.get('href') or u'').strip()
-        self.fullpath = self._build_fullpath(element)
-        wrapper = wrappers.get(element.get(UID_ATTR, ''))
+        self.url      = resolve_url(element.get('href') or u'')
+        self.fullpath = self._build_fullpath(index, pos)
+        wrapper = wrappers.get(pos)
 
         rv = [[], []]
-        self._build_paths(element, rv)
+        self._build_paths(index, pos, rv)
         self.paths = rv[0] + rv[1]
 
         if wrapper is not None:
@@ -115,72 +173,68 @@ class Entry(object):
                 self.title = wrapper_title
         if not self.title:
             l = 0
-            for img in self.element.iterdescendants('img'):
+            for img in index.descendants(pos, 'img'):
+                img   = index.elements[img]
                 title = (img.get('alt') or '').strip() or (img.get('title') or '').strip()
                 if len(title) > l:
                     self.title = title
-                    self.score = SCORE_IMG
+                    self.kind  = 'img'
                     l = len(title)
         if not is_valid_url(self.url):
-            self.score = SCORE_DENY_URL
+            self.kind = 'deny_url'
         elif not self.title:
-            self.score = SCORE_NO_TITLE
+            self.kind = 'no_title'
         else:
             title = self._shrink_title(self.title)
             if len(title) <= 6 or LABEL_MATCH(self.title):
-                self.score = SCORE_LABEL
+                self.kind = 'label'
             elif len(title) <= 8:
-                self.score = SCORE_SHORT
+                self.kind = 'short'
+        self.score = getattr(scoring, self.kind)
 
     def _shrink_title(self, title):
         title = unicodedata.normalize('NFKD', to_unicode(title))
         return SHRINK_SUB(u'', title)
 
-    def _build_paths(self, el, rv):
-        tag = el.tag
-        ids = None
-        if tag in ('html', 'body'):
-            paths = [(tag,)]
-        else:
-            tagid = el.get('id', '').strip() if rv[0] else ''
-            if tagid and tag != 'a':
-                xsel = ('%s#%s' % (tag, tagid),)
-                ids  = [xsel + x for x in rv[0]] if rv[0] else [xsel]
-            classes = el.get('class', '').split()[:2] # important class(es) may be put first.
-            paths   = [('%s.%s' % (tag, x),) for x in classes]
-            if tag == 'th' or tag == 'td':
-                idx = el.get(INDEX_ATTR, None)
-                if idx:
-                    paths = [('%s:nth-child(%s)' % (tag, idx),)]
+    def _build_paths(self, index, pos, rv):
+        while pos >= 0:
+            tag = index.tag(pos)
+            ids = None
+            if tag in ('html', 'body'):
+                paths = [(tag,)]
+            else:
+                tagid = index.id_name(pos).strip() if rv[0] else ''
+                if tagid and tag != 'a':
+                    xsel = ('%s#%s' % (tag, tagid),)
+                    ids  = [xsel + x for x in rv[0]] if rv[0] else [xsel]
+                classes = index.class_tokens(pos)[:2] # important class(es) may be put first.
+                paths   = [('%s.%s' % (tag, x),) for x in classes]
+                if tag == 'th' or tag == 'td':
+                    idx = index.elements[pos].get(INDEX_ATTR, None)
+                    if idx:
+                        paths = [('%s:nth-child(%s)' % (tag, idx),)]
+                    else:
+                        paths.append((tag,))
+                #elif not paths or (tag != 'div' and tag != 'p' and tag != 'span'):
                 else:
                     paths.append((tag,))
-            #elif not paths or (tag != 'div' and tag != 'p' and tag != 'span'):
-            else:
-                paths.append((tag,))
-        if len(rv[0]) + len(rv[1]) > 32:
-            paths = paths[-1:]
-            ids   = None
-        rv[0] = [x + y for x, y in itertools.product(paths, rv[0])] if rv[0] else paths
-        if rv[1]:
-            xsel  = paths[-1]
-            rv[1] = [xsel + x for x in rv[1]]
-        if ids is not None:
-            rv[1] += ids
-        parent = el.getparent()
-        if parent is not None:
-            self._build_paths(parent, rv)
-
-    def _build_fullpath(self, el):
-        path = []
-        for parent in reversed([x for x in el.iterancestors()]):
-            tag = parent.tag
-            cls = '.'.join(sorted(parent.get('class', '').split()))
-            if cls:
-                path.append('%s.%s' % (tag, cls))
-            else:
-                path.append(tag)
-        path.append(el.tag) # a tag's class may indicate click behavior so should not be included.
-        return '>'.join(path)
+            if len(rv[0]) + len(rv[1]) > 32:
+                paths = paths[-1:]
+                ids   = None
+            rv[0] = [x + y for x, y in itertools.product(paths, rv[0])] if rv[0] else paths
+            if rv[1]:
+                xsel  = paths[-1]
+                rv[1] = [xsel + x for x in rv[1]]
+            if ids is not None:
+                rv[1] += ids
+            pos = index.parents[pos]
+
+    def _build_fullpath(self, index, pos):
+        # a tag's class may indicate click behavior so should not be included.
+        parent = index.parents[pos]
+        if parent < 0:
+            return index.tag(pos)
+        return index.fullpath_prefix(parent) + '>' + index.tag(pos)
 
 
 class Path(object):
@@ -198,7 +252,7 @@ class Path(object):
         return frozenset(self._entry_keys)
 
     def add_entry(self, entry):
-        key = entry.element.get(UID_ATTR, '0')
+        key = entry.pos
         if key not in self._entry_keys:
             self._entry_keys.add(key)
             self.entries.append(entry)
@@ -210,76 +264,85 @@ class Path(object):
 
 
 class PathBuilder(object):
-
-    def __init__(self, document):
-        self._doc      = document
-        self._el_id    = 1
-        self._cbg_map  = {}
-        self._prev_id  = 0
-        self._hdr_id   = self._new_id()
-        self._cur_id   = self._new_id()
-        self._paths    = {}
-        self.paths     = []
-        self._wrappers = {}
-        self._a_count  = 0
-        self._last_a   = None
+    """
+    Builds the Paths of every link of a document. With `only` (Path.path tuples), only those
+    paths are built, which is how a TemplateCache hit skips the full search.
+    """
+
+    def __init__(self, document, scoring=DEFAULT_SCORING, only=None):
+        self._doc       = document
+        self._scoring   = scoring
+        self._only      = None
+        if only is not None:
+            self._only  = (frozenset([Path.key_from(x) for x in only]),
+                           sorted(set([len(x) for x in only])))
+        self._index     = document.index
+        self._tag_types = [TAG_TYPE.get(x.lower(), None) for x in self._index.tag_names]
+        self._cbg_map   = {}
+        self._prev_id   = 0
+        self._hdr_id    = self._new_id()
+        self._cur_id    = self._new_id()
+        self._paths     = {}
+        self.paths      = []
+        self._wrappers  = {}
+        self._a_count   = 0
+        self._last_a    = None
         self._build_tree()
 
     def _remove_duplicated_id(self):
-        dups = set()
-        for el in self._doc.root.iter():
-            id_attr = el.get('id', '').strip()
+        index = self._index
+        dups  = set()
+        for pos in xrange(len(index)):
+            id_attr = index.id_name(pos).strip()
             if id_attr and id_attr in dups:
-                del el.attrib['id']
+                index.remove_id(pos)
             dups.add(id_attr)
 
     def _new_id(self):
         self._prev_id += 1
         return self._prev_id
 
-    def _cbg_anchor(self, el, tag):
-        el_id = el.get(UID_ATTR, '0')
-        self._cbg_map[el_id] = self._cur_id
+    def _cbg_anchor(self, pos):
+        self._cbg_map[pos] = self._cur_id
         self._a_count += 1
-        self._last_a = el_id
-        self._context_base_grouping(el)
+        self._last_a = pos
+        self._context_base_grouping(pos)
 
-    def _cbg_wrapper(self, el, tag):
+    def _cbg_wrapper(self, pos):
         outer = self._a_count
         self._a_count = 0
         self._last_a = None
-        self._context_base_grouping(el)
+        self._context_base_grouping(pos)
         if self._a_count == 1 and self._last_a is not None:
-            self._wrappers[self._last_a] = el
+            self._wrappers[self._last_a] = self._index.elements[pos]
         self._a_count += outer
         self._last_a = None
 
-    def _cbg_header(self, el, tag):
+    def _cbg_header(self, pos):
         self._cur_id = self._hdr_id
-        self._context_base_grouping(el)
+        self._context_base_grouping(pos)
         self._cur_id = self._new_id()
 
-    def _cbg_grouping(self, el, tag):
+    def _cbg_grouping(self, pos):
         self._cur_id = self._new_id()
-        self._context_base_grouping(el)
+        self._context_base_grouping(pos)
         self._cur_id = self._new_id()
 
     def _context_base_grouping(self, parent):
-        for el in parent:
-            tag = el.tag.lower()
-            tag_type = TAG_TYPE.get(tag, None)
-            el.set(UID_ATTR, STR_TYPE(self._el_id))
-            self._el_id += 1
+        tags      = self._index.tags
+        tag_types = self._tag_types
+        for pos in self._index.children(parent):
+            tag_type = tag_types[tags[pos]]
             if tag_type == TAG_ANCHOR:
-                self._cbg_anchor(el, tag)
+                self._cbg_anchor(pos)
             elif tag_type == TAG_WRAPPER:
-                self._cbg_wrapper(el, tag)
+                self._cbg_wrapper(pos)
             elif tag_type == TAG_HEADER:
-                self._cbg_header(el, tag)
+                self._cbg_header(pos)
             elif tag_type == TAG_GROUP:
-                self._cbg_grouping(el, tag)
+                self._cbg_grouping(pos)
             else:
-                self._context_base_grouping(el)
+                self._context_base_grouping(pos)
 
     def _add_path(self, path, entry):
         for i in xrange(3, len(path) + 1):
@@ -292,35 +355,60 @@ class PathBuilder(object):
                 self.paths.append(value)
             value.add_entry(entry)
 
-    def _iter_links(self, doc):
+    def _add_only_paths(self, path, entry):
+        keys, lengths = self._only
+        for i in lengths:
+            if i > len(path):
+                break
+            sub = path[:i]
+            key = Path.key_from(sub)
+            if key in keys:
+                value = self._paths.get(key)
+                if value is None:
+                    value = Path(sub)
+                    self._paths[key] = value
+                    self.paths.append(value)
+                value.add_entry(entry)
+
+    def _iter_links(self):
         default_id = self._new_id()
-        cbg_map = self._cbg_map
+        index    = self._index
+        cbg_map  = self._cbg_map
         wrappers = self._wrappers
-        return (Entry(x, cbg_map.get(x.get(UID_ATTR, '0'), default_id), wrappers)
-                for x in doc.iterdescendants('a') if LINK_MATCH(x.get(u'href', u'')))
+        resolver = self._doc.resolver
+        is_link  = resolver.is_link
+        scoring  = self._scoring
+        # links in document order, the root itself excluded.
+        return (Entry(index, x, cbg_map.get(x, default_id), wrappers, resolver, scoring)
+                for x in index.positions('a')
+                if x > 0 and is_link(index.elements[x].get(u'href')))
 
     def _build_tree(self):
         self._remove_duplicated_id()
         # [TODO] Nested A tags should be removed.
-        self._context_base_grouping(self._doc.root)
-        for entry in self._iter_links(self._doc.root):
+        self._context_base_grouping(0)
+        add_path = self._add_path if self._only is None else self._add_only_paths
+        for entry in self._iter_links():
             for path in entry.paths:
-                self._add_path(path, entry)
+                add_path(path, entry)
 
 
 class EntryGroup(object):
-    __slots__ = ('score', 'cbg_score', 'paths', 'entries', 'url_set')
+    __slots__ = ('score', 'cbg_score', 'paths', 'entries', 'url_set',
+                 '_kinds', '_dups', '_fullpaths', '_cbgs')
 
-    def __init__(self, entries):
+    def __init__(self, entries, scoring=DEFAULT_SCORING):
         assert len(entries) > 0, 'Group entries must not be empty'
-        self.score     = sum([x.score for x in entries])
-        self.cbg_score = self.score
         self.paths     = []
         self.entries   = list(entries)
         self.url_set   = frozenset([x.url for x in entries])
-        self._score_duplication()
-        self._score_fullpath()
-        self.cbg_score = self._score_cbg()
+        self._kinds    = defaultdict(int)
+        for entry in self.entries:
+            self._kinds[entry.kind] += 1
+        self._dups      = self._count_duplication()
+        self._fullpaths = self._count_fullpath()
+        self._cbgs      = len(frozenset([x.cbg_id for x in self.entries]))
+        self.rescore(scoring)
 
     def add_path(self, path):
         self.paths.append(path)
@@ -328,92 +416,156 @@ class EntryGroup(object):
     def __len__(self):
         return len(self.entries)
 
-    def _score_duplication(self):
+    def rescore(self, scoring):
+        """(Re)computes score and cbg_score; entry features are counted once, in __init__."""
+        self.score = sum([getattr(scoring, k) * v for k, v in iteritems(self._kinds)])
+        for kind in self._dups:
+            self.score += getattr(scoring, kind)
+        if self._fullpaths > 1:
+            self.score /= self._fullpaths * scoring.fullpath_scale
+        self.cbg_score = self._score_cbg(scoring)
+
+    def _count_duplication(self):
+        rv     = []
         keys   = set()
         urls   = set()
         titles = set()
         for entry in self.entries:
             key = (entry.title, entry.url)
             if key in keys:
-                self.score += SCORE_DUP_KEY
+                rv.append('dup_key')
             elif entry.url in urls:
-                self.score += SCORE_DUP_URL
+                rv.append('dup_url')
             elif entry.title in titles:
-                self.score += SCORE_DUP_TITLE
+                rv.append('dup_title')
             keys.add(key)
             urls.add(entry.url)
             titles.add(entry.title)
+        return rv
 
-    def _score_fullpath(self):
+    def _count_fullpath(self):
         counts = defaultdict(int)
         for entry in self.entries:
             counts[entry.fullpath] += 1
-        count = len([k for k, v in iteritems(counts) if v > 1])
-        if count > 1:
-            self.score /= count * 0.9
+        return len([k for k, v in iteritems(counts) if v > 1])
 
-    def _score_cbg(self):
+    def _score_cbg(self, scoring):
         score = self.score
-        scale = 0.6 if score > 0 else 1.5
-        for x in xrange(1, len(frozenset([x.cbg_id for x in self.entries]))):
+        scale = scoring.cbg_decay if score > 0 else scoring.cbg_growth
+        for x in xrange(1, self._cbgs):
             score *= scale
         return score
 
 
 class Optimizer(object):
 
-    def __init__(self, paths):
-        group_map    = {}
-        self._groups = []
+    def __init__(self, paths, scoring=DEFAULT_SCORING):
+        group_map        = {}
+        self._scoring    = scoring
+        self._groups     = []
+        self._occlusions = {}
         for path in paths:
             if len(path.entries) <= 0:
                 continue
             key   = path.fingerprint
             group = group_map.get(key)
             if group is None:
-                group = group_map[key] = EntryGroup(path.entries)
+                group = group_map[key] = EntryGroup(path.entries, scoring)
                 self._groups.append(group)
             group.add_path(path)
 
-    def sort_groups(self):
-        return sorted(self._groups, key=lambda x:(x.score, x.cbg_score), reverse=True)
+    def rescore(self, scoring):
+        """Rescores every group, so that optimize() can be run again with other parameters."""
+        self._scoring = scoring
+        for group in self._groups:
+            group.rescore(scoring)
+
+    def sort_groups(self, groups=None):
+        groups = self._groups if groups is None else groups
+        return sorted(groups, key=lambda x:(x.score, x.cbg_score), reverse=True)
 
     def optimize(self):
-        self._remove_small_groups(4)
-        self._occlusion_culling()
-        groups = self.sort_groups()
+        """Returns the best groups. Culled groups keep their penalty until rescore()."""
+        scoring = self._scoring
+        groups  = self._remove_small_groups(scoring.small_group)
+        self._occlusion_culling(groups, scoring.small_group)
+        groups = self.sort_groups(groups)
         result = [x for x in groups if x.score > 0]
-        if len(result) >= 4:
-            return result[:8]
+        if len(result) >= scoring.min_groups:
+            return result[:scoring.max_groups]
         else:
-            return groups[:4]
+            return groups[:scoring.min_groups]
 
     def _remove_small_groups(self, threshold):
-        self._groups = [x for x in self._groups if len(x) > threshold]
-
-    def _occlusion_culling(self):
-        for a, b in itertools.combinations(self._groups, 2):
+        return [x for x in self._groups if len(x) > threshold]
+
+    def _occlusion_culling(self, groups, threshold):
+        # Which groups' urls contain the others' doesn't depend on scores; the pairs are kept
+        # per small group threshold for later rescored runs.
+        pairs = self._occlusions.get(threshold)
+        if pairs is None:
+            pairs = self._occlusions[threshold] = [
+                (a, b) for a, b in itertools.combinations(groups, 2)
+                if a.url_set <= b.url_set or b.url_set <= a.url_set]
+        for a, b in pairs:
             if a.cbg_score <= 0 or b.cbg_score <= 0:
                 continue
-            lab, lba = len(a.url_set - b.url_set), len(b.url_set - a.url_set)
-            if lab == 0 or lba == 0:
-                culled = (a if a.cbg_score < b.cbg_score else b)
-                culled.score = culled.cbg_score = -65536
+            culled = (a if a.cbg_score < b.cbg_score else b)
+            culled.score = culled.cbg_score = -65536
 
 
 class Detector(BaseComponent):
+    """
+    With `template_cache`, the winning group paths of each page are remembered by host and
+    page signature (see template.TemplateCache). Pages that nearly match a remembered one only
+    build those paths, and fall back to the full search if any of its groups doesn't come back.
+    """
 
     def __init__(self, config={}):
         super(Detector, self).__init__(config)
         self._skip_optimization = config.get('skip_optimization', False)
+        self._scoring = config.get('scoring') or DEFAULT_SCORING
+        self.templates = None
+        if config.get('template_cache'):
+            from .template import TemplateCache
+            self.templates = TemplateCache(config.get('template_distance', 6))
 
     def prepare(self, doc):
-        set_index(doc.root)
+        set_index(doc.index)
+
+    def build(self, doc, only=None):
+        """Groups the links of a prepared and filtered document; returns their Optimizer."""
+        return Optimizer(PathBuilder(doc, self._scoring, only).paths, self._scoring)
 
     def run(self, doc):
-        paths     = PathBuilder(doc).paths
-        optimizer = Optimizer(paths)
         if self._skip_optimization:
-            return optimizer.sort_groups()
+            return self.build(doc).sort_groups()
+        elif self.templates is not None:
+            return self._run_template(doc)
         else:
-            return optimizer.optimize()
+            return self.build(doc).optimize()
+
+    def _run_template(self, doc):
+        from .template import page_host, page_signature
+        host      = page_host(doc.url)
+        signature = page_signature(doc.index)
+        template  = self.templates.get(host, signature)
+        if template is not None:
+            groups = self._apply_template(doc, template)
+            if groups is not None:
+                return groups
+            self.templates.reject()
+        groups = self.build(doc).optimize()
+        if groups:
+            # an empty template would validate on any page of the layout
+            self.templates.put(host, signature,
+                               [[x.path for x in group.paths] for group in groups])
+        return groups
+
+    def _apply_template(self, doc, template):
+        groups = self.build(doc, [x for paths in template for x in paths]).optimize()
+        found  = set([x.key for group in groups for x in group.paths])
+        for paths in template:
+            if not any(Path.key_from(x) in found for x in paths):
+                return None
+        return groups
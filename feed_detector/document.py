@@ -2,24 +2,38 @@
 
 from __future__ import absolute_import, division, print_function, unicode_literals
 
-try:
-    import cchardet as chardet
-except Exception:
-    import chardet
-
 import copy
-import lxml.html
-import lxml.html.clean
 import re
 import sys
+import threading
 
 from .abstract import BaseComponent
 from .compat   import *
+from .index    import DomIndex
+from .util     import UrlResolver
+
+if sys.version_info[0] == 3:
+    from urllib.parse import urljoin
+else:
+    from urlparse import urljoin
 
 
 __all__ = ('Encoding', 'Document')
 
 
+# Per thread lxml parsers, see Document.get_parser().
+_local = threading.local()
+
+# lxml and chardet are imported on first use so that short-lived processes,
+# e.g. `feed_detector --help`, don't pay for them.
+def _detect_charset(text):
+    try:
+        import cchardet as chardet
+    except Exception:
+        import chardet
+    return chardet.detect(text)
+
+
 # Encoding detection code from python-readability.
 class Encoding(object):
     RE_CHARSET = re.compile(br'''<meta[^>]+?charset=["']?([-_0-9A-Z]+)''', flags=re.I)
@@ -77,7 +91,7 @@ class Encoding(object):
         enc = 'utf-8'
         if len(text) < 10:
             return enc # can't guess
-        res = chardet.detect(text)
+        res = _detect_charset(text)
         enc = res['encoding'] or 'utf-8'
         #print '->', enc, "%.2f" % res['confidence']
         enc = self.fix_charset(enc)
@@ -85,14 +99,14 @@ class Encoding(object):
 
 
 class Document(BaseComponent):
-    PARSER  = lxml.html.HTMLParser(encoding='utf-8')
-    CLEANER = lxml.html.clean.Cleaner(
+    PARSER  = None  # set to share one parser; otherwise every thread gets its own.
+    CLEANER = None  # holds options only, so it's shared between threads.
+    CLEANER_OPTIONS = dict(
         scripts=True, javascript=True, comments=True,
         style=True, links=True, meta=False, add_nofollow=False,
         page_structure=False, processing_instructions=True, embedded=False,
         frames=False, forms=False, annoying_tags=False, remove_tags=None,
         remove_unknown_tags=False, safe_attrs_only=False)
-    XPATH_PREFIX_RE = re.compile(STR_TYPE(r'/html/'))
 
     def __init__(self, source, url=None, tree=None, config={}):
         super(Document, self).__init__(config)
@@ -104,6 +118,8 @@ class Document(BaseComponent):
         self._url = url
         self._tree = self._load_html() if tree is None else tree
         self._doc = self._tree.getroot()
+        self._resolver = None
+        self._index = None
 
     @property
     def root(self):
@@ -113,21 +129,61 @@ class Document(BaseComponent):
     def tree(self):
         return self._tree
 
+    @property
+    def url(self):
+        return self._url
+
+    @property
+    def index(self):
+        """DomIndex of the document, built on first use."""
+        if self._index is None:
+            self._index = DomIndex(self._doc)
+        return self._index
+
+    def reset_index(self):
+        """Must be called after elements are added, removed or moved."""
+        self._index = None
+
+    @property
+    def resolver(self):
+        """UrlResolver for the document's links, honoring <base href>."""
+        if self._resolver is None:
+            base = self._url
+            base_href = None
+            for el in self._doc.iterfind('.//base[@href]'):
+                base_href = el.get('href').strip()
+            if base_href:
+                base = urljoin(base, base_href) if base else base_href
+            self._resolver = UrlResolver(base)
+        return self._resolver
+
     def copy(self):
         return self.__copy__()
 
+    @classmethod
+    def get_parser(cls):
+        # lxml parsers must not be used by two threads at once.
+        if cls.PARSER is not None:
+            return cls.PARSER
+        parser = getattr(_local, 'parser', None)
+        if parser is None:
+            import lxml.html
+            parser = _local.parser = lxml.html.HTMLParser(encoding='utf-8')
+        return parser
+
+    @classmethod
+    def get_cleaner(cls):
+        if cls.CLEANER is None:
+            import lxml.html.clean
+            cls.CLEANER = lxml.html.clean.Cleaner(**cls.CLEANER_OPTIONS)
+        return cls.CLEANER
+
     def create_fragment(self, s):
+        import lxml.html
         return lxml.html.fragment_fromstring(s)
 
-    def add_xpath(self):
-        tree = self._tree
-        prefix = STR_TYPE('/')
-        prefix_re = self.XPATH_PREFIX_RE
-        for el in self._doc.iter():
-            if isinstance(el, lxml.html.HtmlElement):
-                el.set('x', prefix_re.sub(prefix, tree.getpath(el)))
-
     def html(self, element=None):
+        import lxml.html
         if element is None:
             element = self._doc
         return lxml.html.tostring(element, pretty_print=True, encoding='unicode')
@@ -137,21 +193,13 @@ class Document(BaseComponent):
 
     def __deepcopy__(self, memo):
         tree = copy.deepcopy(self._tree, memo)
-        return Document(self._source, url=self._url, tree=tree, config=self.config)
+        doc = Document(self._source, url=self._url, tree=tree, config=self.config)
+        doc._resolver = self.resolver
+        return doc
 
     def _load_html(self):
-        doc = lxml.html.document_fromstring(self._source, parser=self.PARSER)
-        if self._url:
-            try:
-                # such support is added in lxml 3.3.0
-                doc.make_links_absolute(self._url, resolve_base_href=True,
-                                        handle_failures='discard')
-            except TypeError:
-                # make_links_absolute() got an unexpected keyword argument 'handle_failures'
-                # then we have lxml < 3.3.0
-                # please upgrade to lxml >= 3.3.0 if you're failing here!
-                doc.make_links_absolute(base_href, resolve_base_href=True)
-        else:
-            doc.resolve_base_href()
-        doc = self.CLEANER.clean_html(doc)
+        import lxml.html
+        # Links are left relative here. Entries resolve their own urls through `resolver`.
+        doc = lxml.html.document_fromstring(self._source, parser=self.get_parser())
+        doc = self.get_cleaner().clean_html(doc)
         return doc.getroottree()
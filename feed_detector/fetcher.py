@@ -0,0 +1,319 @@
+# -*- coding: utf-8 -*-
+
+# asyncio based fetcher. Python 3 only.
+
+import asyncio
+import ssl
+import time
+
+from collections        import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse       import urljoin, urlsplit
+
+from .abstract import BaseComponent
+from .worker   import worker_config, init_worker, detect
+
+
+__all__ = ('FetchError', 'Response', 'ConnectionPool', 'AsyncFetcher', 'FetchPipeline')
+
+
+REDIRECT_STATUSES = frozenset((301, 302, 303, 307, 308))
+NO_BODY_STATUSES  = frozenset((204, 304))
+DEFAULT_PORTS     = { 'http': 80, 'https': 443 }
+
+
+class FetchError(Exception):
+    pass
+
+
+class Response(object):
+    __slots__ = ('url', 'status', 'headers', 'body')
+
+    def __init__(self, url, status, headers, body):
+        self.url     = url
+        self.status  = status
+        self.headers = headers  # lower cased names
+        self.body    = body
+
+
+class ConnectionPool(object):
+    """
+    Keeps idle keep-alive connections per (scheme, host, port). Connections idle for longer
+    than `idle_timeout` seconds are not reused; evict() closes them.
+    """
+
+    def __init__(self, max_idle_per_host=4, idle_timeout=30.0):
+        self._max_idle     = max_idle_per_host
+        self._idle_timeout = idle_timeout
+        self._idle         = defaultdict(list)  # key -> [(reader, writer, released at)]
+        self._ssl          = None
+
+    async def acquire(self, key):
+        idle     = self._idle.get(key)
+        deadline = time.monotonic() - self._idle_timeout
+        while idle:
+            reader, writer, released = idle.pop()
+            if released >= deadline and not reader.at_eof() and not writer.is_closing():
+                return reader, writer, True
+            writer.close()
+        scheme, host, port = key
+        if scheme == 'https':
+            if self._ssl is None:
+                self._ssl = ssl.create_default_context()
+            reader, writer = await asyncio.open_connection(host, port, ssl=self._ssl,
+                                                           server_hostname=host)
+        else:
+            reader, writer = await asyncio.open_connection(host, port)
+        return reader, writer, False
+
+    def release(self, key, reader, writer, reusable):
+        idle = self._idle[key]
+        if reusable and len(idle) < self._max_idle:
+            idle.append((reader, writer, time.monotonic()))
+        else:
+            writer.close()
+
+    def evict(self):
+        """Closes the connections idle for longer than idle_timeout."""
+        deadline = time.monotonic() - self._idle_timeout
+        for key in list(self._idle):
+            idle = self._idle[key]
+            for reader, writer, released in idle:
+                if released < deadline:
+                    writer.close()
+            idle[:] = [x for x in idle if x[2] >= deadline]
+            if not idle:
+                del self._idle[key]
+
+    def close(self):
+        for idle in self._idle.values():
+            for reader, writer, released in idle:
+                writer.close()
+        self._idle.clear()
+
+
+class AsyncFetcher(BaseComponent):
+    """
+    Minimal HTTP/1.1 client with per host connection pooling. Concurrency is limited globally
+    and per host, each fetch (including redirects) is bounded by `timeout` seconds and bodies
+    larger than `max_size` bytes are rejected. Keep-alive connections idle for more than
+    `idle_timeout` seconds are closed by evict_idle().
+    """
+
+    DEFAULT_CONFIG = {
+        'concurrency':          32,
+        'per_host_concurrency': 4,
+        'max_idle_per_host':    4,
+        'idle_timeout':         30.0,
+        'timeout':              20.0,
+        'max_size':             8 * 1024 * 1024,
+        'max_redirects':        5,
+        'user_agent':           'Mozilla/5.0',
+    }
+
+    def __init__(self, config={}):
+        super(AsyncFetcher, self).__init__(config)
+        self._pool       = ConnectionPool(self.config['max_idle_per_host'],
+                                          self.config['idle_timeout'])
+        self._semaphore  = None
+        self._host_semas = {}
+
+    async def fetch(self, url, headers=None):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.config['concurrency'])
+        async with self._semaphore:
+            return await asyncio.wait_for(self._fetch(url, headers or {}),
+                                          self.config['timeout'])
+
+    def evict_idle(self):
+        self._pool.evict()
+
+    def close(self):
+        # the semaphores are bound to the event loop they were first used in
+        self._pool.close()
+        self._semaphore  = None
+        self._host_semas = {}
+
+    async def _fetch(self, url, headers):
+        for i in range(self.config['max_redirects'] + 1):
+            response = await self._fetch_once(url, headers)
+            location = response.headers.get('location')
+            if response.status not in REDIRECT_STATUSES or not location:
+                return response
+            url = urljoin(url, location.strip())
+        raise FetchError('too many redirects: %s' % url)
+
+    async def _fetch_once(self, url, headers):
+        parts = urlsplit(url)
+        if parts.scheme not in DEFAULT_PORTS or not parts.hostname:
+            raise FetchError('unsupported url: %s' % url)
+        key  = (parts.scheme, parts.hostname, parts.port or DEFAULT_PORTS[parts.scheme])
+        sema = self._host_semas.get(key)
+        if sema is None:
+            sema = self._host_semas[key] = asyncio.Semaphore(self.config['per_host_concurrency'])
+        request = self._build_request(parts, headers)
+        async with sema:
+            reader, writer, reused = await self._pool.acquire(key)
+            try:
+                try:
+                    writer.write(request)
+                    status, resp_headers, keep_alive = await self._read_head(reader)
+                except (ConnectionError, asyncio.IncompleteReadError):
+                    if not reused:
+                        raise
+                    # The server has closed an idle connection. Retry on a fresh one.
+                    writer.close()
+                    reader, writer, reused = await self._pool.acquire(key)
+                    writer.write(request)
+                    status, resp_headers, keep_alive = await self._read_head(reader)
+                body, delimited = await self._read_body(reader, status, resp_headers)
+            except BaseException:
+                writer.close()
+                raise
+            self._pool.release(key, reader, writer, keep_alive and delimited)
+        return Response(url, status, resp_headers, body)
+
+    def _build_request(self, parts, headers):
+        path = parts.path or '/'
+        if parts.query:
+            path += '?' + parts.query
+        host = parts.hostname
+        if parts.port:
+            host += ':%d' % parts.port
+        lines = ['GET %s HTTP/1.1' % path,
+                 'Host: %s' % host,
+                 'User-Agent: %s' % self.config['user_agent'],
+                 'Accept: text/html,application/xhtml+xml,*/*;q=0.8',
+                 'Accept-Encoding: identity',
+                 'Connection: keep-alive']
+        lines.extend(['%s: %s' % x for x in headers.items()])
+        return ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1')
+
+    async def _read_head(self, reader):
+        line = await reader.readline()
+        if not line:
+            raise asyncio.IncompleteReadError(line, None)
+        try:
+            version, status = line.split(None, 2)[:2]
+            status = int(status)
+        except ValueError:
+            raise FetchError('malformed status line: %r' % line)
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if not line:
+                raise asyncio.IncompleteReadError(line, None)
+            if line in (b'\r\n', b'\n'):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            name, value = name.strip().lower(), value.strip()
+            headers[name] = headers[name] + ', ' + value if name in headers else value
+        keep_alive = (version == b'HTTP/1.1' and
+                      headers.get('connection', '').lower() != 'close')
+        return status, headers, keep_alive
+
+    async def _read_body(self, reader, status, headers):
+        max_size = self.config['max_size']
+        if status in NO_BODY_STATUSES or 100 <= status < 200:
+            return b'', True
+        if 'chunked' in headers.get('transfer-encoding', '').lower():
+            chunks = []
+            size = 0
+            while True:
+                line = await reader.readline()
+                try:
+                    length = int(line.split(b';', 1)[0].strip(), 16)
+                except ValueError:
+                    raise FetchError('malformed chunk header: %r' % line)
+                if length == 0:
+                    break
+                size += length
+                if size > max_size:
+                    raise FetchError('response is larger than %d bytes' % max_size)
+                chunks.append(await reader.readexactly(length))
+                await reader.readline()
+            while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                pass # trailers
+            return b''.join(chunks), True
+        length = headers.get('content-length')
+        if length is not None:
+            try:
+                length = int(length)
+            except ValueError:
+                raise FetchError('malformed content-length: %r' % length)
+            if length > max_size:
+                raise FetchError('response is larger than %d bytes' % max_size)
+            return await reader.readexactly(length), True
+        body = await reader.read(max_size + 1)
+        while len(body) <= max_size:
+            data = await reader.read(max_size + 1 - len(body))
+            if not data:
+                break
+            body += data
+        if len(body) > max_size:
+            raise FetchError('response is larger than %d bytes' % max_size)
+        return body, False
+
+
+class FetchPipeline(BaseComponent):
+    """
+    Fetches documents with AsyncFetcher and runs detection on a process pool, so network i/o
+    overlaps with parsing. Results are RecordFormatter records (or the configured formatter's).
+    """
+
+    DEFAULT_CONFIG = {
+        'workers': None,  # defaults to the number of cpus
+    }
+
+    def __init__(self, config={}):
+        super(FetchPipeline, self).__init__(config)
+        self._fetcher  = AsyncFetcher(config)
+        self._executor = None
+
+    def run(self, urls):
+        """Returns a list of (url, groups, error) in the order of `urls`."""
+        return asyncio.run(self.detect_urls(urls))
+
+    def run_each(self, urls, callback):
+        """Calls callback(url, groups, error) as soon as each url is done, in any order."""
+        asyncio.run(self._detect_each(urls, callback))
+
+    async def detect_urls(self, urls):
+        self.open()
+        try:
+            return await asyncio.gather(*[self.detect_url(x) for x in urls])
+        finally:
+            self.close()
+
+    async def _detect_each(self, urls, callback):
+        self.open()
+        try:
+            for result in asyncio.as_completed([self.detect_url(x) for x in urls]):
+                callback(*(await result))
+        finally:
+            self.close()
+
+    async def detect_url(self, url):
+        try:
+            response = await self._fetcher.fetch(url)
+            if response.status != 200:
+                raise FetchError('HTTP status %d' % response.status)
+            groups = await self.detect_body(response.body, response.url)
+        except Exception as e:
+            return url, None, '%s: %s' % (type(e).__name__, e)
+        return url, groups, None
+
+    async def detect_body(self, body, url):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, detect, body, url)
+
+    def open(self):
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(self.config['workers'], initializer=init_worker,
+                                                 initargs=(worker_config(self.config),))
+
+    def close(self):
+        self._fetcher.close()
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
@@ -1,22 +1,21 @@
 # -*- coding: utf-8 -*-
 
 from __future__ import absolute_import, division, print_function, unicode_literals
+import bisect
 import re
+import threading
 
 from .abstract import AbstractFilter
-from .compat   import to_unicode
+from .compat   import *
 
 
-__all__ = ('BodyRemovalFilter',)
+__all__ = ('FilterStats', 'BodyRemovalFilter')
 
 
 DIV_TO_P_TAGS = (u'a', u'blockquote', u'dl', u'div', u'img', u'ol', u'p', u'pre', u'table', u'ul')
-UNLIKELY_CANDIDATES_RE = re.compile(u'combx|comment|community|disqus|extra|foot|header|menu|remark|rss|shoutbox|sidebar|sponsor|ad-break|agegate|pagination|pager|popup|tweet|twitter', re.I)
-MAYBE_CANDIDATE_RE = re.compile(u'and|article|body|column|main|shadow', re.I)
 CLEAN_LF_RE = re.compile(to_unicode(r'\s*\n\s*'))
 CLEAN_TAB_RE = re.compile(to_unicode(r'\t|[ \t]{2,}'))
-POSITIVE_RE = re.compile(u'article|pagination|post|text|blog|story', re.I)
-NEGATIVE_RE = re.compile(u'combx|comment|com-|contact|foot|footer|footnote|masthead|media|meta|outbrain|promo|related|scroll|shoutbox|sidebar|sponsor|shopping|tags|tool|widget', re.I)
+CANDIDATE_SCORE = 15.0  # minimum score of a body candidate
 
 
 def _clean_text(text):
@@ -24,31 +23,15 @@ def _clean_text(text):
     text = CLEAN_TAB_RE.sub(' ', text)
     return text.strip()
 
-def _get_text_length(el):
-    return len(_clean_text(el.text_content() or ''))
-
-def _get_link_density(el):
-    link_length = 0
-    for i in el.iterdescendants('a'):
-        link_length += _get_text_length(i)
-    return link_length / max(_get_text_length(el), 1)
-
 def _score_text(text):
     return text.count(u',') + text.count(u"\u3001") / 2.0 + 1
 
-def _class_weight(el):
-    weight = 0
-    for feature in (el.get('class', None), el.get('id', None)):
-        if feature:
-            if NEGATIVE_RE.search(feature):
-                weight -= 25
-            if POSITIVE_RE.search(feature):
-                weight += 25
-    return weight
-
-def _score_node(el):
-    score = _class_weight(el)
-    name = el.tag.lower()
+def _class_weight(index, pos):
+    return index.class_info(pos).weight + index.id_info(pos).weight
+
+def _score_node(index, pos):
+    score = _class_weight(index, pos)
+    name = index.tag(pos).lower()
     if name == 'div':
         score += 5
     elif name in ('pre', 'blockquote'):
@@ -57,149 +40,317 @@ def _score_node(el):
         score -= 3
     elif name in ("h1", "h2", "h3", "h4", "h5", "h6", "th"):
         score -= 5
-    return { 'score':score, 'element':el }
+    return { 'score':score, 'pos':pos }
+
+def _iter_tags(index, pos, tags):
+    # like Element.iter(*tags): pos itself first, then its descendants in document order.
+    rv = index.descendants(pos, *tags)
+    if index.tag(pos) in tags:
+        rv.insert(0, pos)
+    return rv
+
+
+class _FilterContext(object):
+    """
+    Per run state of BodyRemovalFilter, so that one filter can serve concurrent runs. Elements
+    are referred to by their position in `index`, the DomIndex of the working copy; `origin`
+    maps them to their position in the filtered document (None for elements the filter added).
+    """
+    __slots__ = ('doc', 'original', 'index', 'origin', 'texts', 'scores', 'excludes', 'done')
+
+    def __init__(self, doc):
+        self.doc      = doc.copy()
+        self.original = self.doc.index
+        self.index    = self.original
+        self.origin   = xrange(len(self.index))
+        self.texts    = {}
+        self.scores   = {}
+        self.excludes = set()
+        self.done     = set()
+
+    def reindex(self):
+        """Re-indexes the working copy after structural changes."""
+        position = self.original.position
+        self.doc.reset_index()
+        self.index  = self.doc.index
+        self.origin = [position(x) for x in self.index.elements]
+        self.texts  = {}
+
+    def text(self, pos):
+        rv = self.texts.get(pos)
+        if rv is None:
+            rv = self.texts[pos] = self.index.elements[pos].text_content() or u''
+        return rv
+
+    def text_length(self, pos):
+        return len(_clean_text(self.text(pos)))
+
+    def link_density(self, pos):
+        link_length = 0
+        for i in self.index.descendants(pos, 'a'):
+            link_length += self.text_length(i)
+        return link_length / max(self.text_length(pos), 1)
+
+
+class FilterStats(object):
+    """Process wide counters of BodyRemovalFilter runs and of the runs it could skip."""
+
+    def __init__(self):
+        self._lock   = threading.Lock()
+        self.runs    = 0
+        self.skipped = 0
+
+    def count(self, skipped):
+        with self._lock:
+            self.runs += 1
+            if skipped:
+                self.skipped += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'runs':      self.runs,
+                'skipped':   self.skipped,
+                'skip_rate': self.skipped / self.runs if self.runs else 0.0,
+            }
 
 
 class BodyRemovalFilter(AbstractFilter):
+    """
+    Removes the article body of a page, so that links in it don't form groups. Unless
+    `fast_skip` is disabled, pages on which no element can score CANDIDATE_SCORE points (index
+    and listing pages, mostly) are recognized up front and left alone; see stats.
+    """
+
+    DEFAULT_CONFIG = {
+        'fast_skip': True,
+    }
+
+    index_aware = True
+    stats       = FilterStats()
 
     def run(self, doc):
-        self._prepare(doc)
-        self._remove_unlikely_candidates()
-        self._inappropriate_div_to_p()
-        self._score_paragraphs()
-        scores = self._reduce_candidates()
+        skip = self.config['fast_skip'] and self._below_threshold(doc)
+        self.stats.count(skip)
+        if skip:
+            return
+        ctx = _FilterContext(doc)
+        self._remove_unlikely_candidates(ctx)
+        self._inappropriate_div_to_p(ctx)
+        self._score_paragraphs(ctx)
+        scores = self._reduce_candidates(ctx)
         if scores:
             drop_list = []
             for score in scores:
-                self._collect_exclude_elements(score['element'])
-                if score['element'].get('x', '') not in self._excludes:
-                    self._collect_drop_paths(drop_list, score['element'])
+                self._collect_exclude_elements(ctx, score['pos'])
+                if ctx.origin[score['pos']] not in ctx.excludes:
+                    self._collect_drop_paths(ctx, drop_list, score['pos'])
             self._drop_text_elements(doc, drop_list)
 
-    def _prepare(self, doc):
-        self._doc  = doc.copy()
-        self._root = self._doc.root
-        self._doc.add_xpath()
-        self._scores = {}
-        self._excludes = set()
-        self._done = set()
+    def _below_threshold(self, doc):
+        """
+        Returns True if no element of doc can score CANDIDATE_SCORE points, i.e. the filter
+        would not remove anything. The <p>s run() would score are worked out on the unfiltered
+        document: <p>s and <pre>s that survive _remove_unlikely_candidates, <div>s that
+        _inappropriate_div_to_p turns into <p>s, and the text and tails it wraps in new <p>s,
+        joined across the children dropped in between. Their text can only shrink in the
+        filter's copy, and link density only lowers a passing score, so the scores computed
+        here bound the real ones from above.
+        """
+        index    = doc.index
+        elements = index.elements
+        parents  = index.parents
+        ends     = index.ends
+        dropped  = self._unlikely_candidates(index)
+        dead     = set(dropped)
+        dead_elements = set([elements[x] for x in dropped])
+        start, end = (dropped[-1], ends[dropped[-1]]) if dropped else (0, 0)
+
+        def alive(pos):
+            return pos not in dead and not (start <= pos < end)
+
+        blocks = sorted([x for tag in DIV_TO_P_TAGS for x in index.positions(tag) if alive(x)])
+        texts  = []  # (parent, text) of every <p> to score
+        for pos in index.descendants(0, 'p', 'pre'):
+            if alive(pos):
+                texts.append((parents[pos], elements[pos].text_content() or u''))
+        for pos in index.descendants(0, 'div'):
+            if not alive(pos):
+                continue
+            i  = bisect.bisect_right(blocks, pos)
+            el = elements[pos]
+            if i < len(blocks) and blocks[i] < ends[pos]:
+                # dropping a child joins its tail to the text before it, so the texts
+                # wrapped in <p>s are the runs of text between the children that survive
+                runs = [el.text or u'']
+                for child in el:
+                    if child in dead_elements:
+                        runs[-1] += child.tail or u''
+                    else:
+                        runs.append(child.tail or u'')
+                texts.extend([(pos, x) for x in runs if x.strip()])
+            else:
+                texts.append((parents[pos], el.text_content() or u''))
 
-    def _remove_unlikely_candidates(self):
+        min_len = self.config.get('body_minimum_length', 0)
+        bounds  = {}
+        for parent, text in texts:
+            text = _clean_text(text)
+            if len(text) < min_len:
+                continue
+            score = 1.0 + _score_text(text) + min((len(text) / 100), 3)
+            bounds[parent] = bounds.get(parent, 0.0) + score
+            grand_parent = parents[parent]
+            if grand_parent >= 0:
+                bounds[grand_parent] = bounds.get(grand_parent, 0.0) + score / 2.0
+        for pos, bound in iteritems(bounds):
+            if index.tag(pos) in ('html', 'head', 'body'):
+                continue
+            # a little slack for the different order of the float additions
+            if _score_node(index, pos)['score'] + bound >= CANDIDATE_SCORE - 1e-6:
+                return False
+        return True
+
+    def _unlikely_candidates(self, index):
+        # Matches the walk of Element.iter() while dropping from the tree: lxml has already
+        # stepped to the next node when an element is dropped, so the walk goes on after a
+        # dropped leaf, but after an element with children it ends inside the dropped subtree.
+        # Only the last position returned can have children.
         except_tags = (u'html', u'body')
-        for el in self._root.iter():
-            s = u"%s %s" % (el.get(u'class', ''), el.get(u'id', u''))
-            if ( len(s) >= 2 and
-                 UNLIKELY_CANDIDATES_RE.search(s) and
-                 not MAYBE_CANDIDATE_RE.search(s) and
-                 el.tag not in except_tags):
-                el.drop_tree()
-
-    def _inappropriate_div_to_p(self):
+        rv = []
+        for pos in xrange(len(index)):
+            cls, id_ = index.class_info(pos), index.id_info(pos)
+            if ( (cls.unlikely or id_.unlikely) and
+                 not (cls.maybe or id_.maybe) and
+                 index.tag(pos) not in except_tags):
+                rv.append(pos)
+                if len(index.elements[pos]):
+                    break
+        return rv
+
+    def _remove_unlikely_candidates(self, ctx):
+        dropped = self._unlikely_candidates(ctx.index)
+        for pos in dropped:
+            ctx.index.elements[pos].drop_tree()
+        if dropped:
+            ctx.reindex()
+
+    def _inappropriate_div_to_p(self, ctx):
+        index = ctx.index
+
         # transform <div>s that do not contain other block elements into <p>s
-        for el in self._root.iterdescendants('div'):
-            if next(el.iterdescendants(*DIV_TO_P_TAGS), None) is None:
-                el.tag = 'p'
+        divs = []
+        for pos in index.descendants(0, 'div'):
+            if any(index.count(pos, x) for x in DIV_TO_P_TAGS):
+                divs.append(index.elements[pos])
+            else:
+                index.elements[pos].tag = 'p'
 
         # wrap texts under <div>s by <p>
-        for el in self._root.iterdescendants('div'):
+        for el in divs:
             if el.text and el.text.strip():
-                p = self._doc.create_fragment('<p/>')
+                p = ctx.doc.create_fragment('<p/>')
                 p.text = el.text
                 el.text = None
                 el.insert(0, p)
 
             for pos, child in reversed(list(enumerate(el))):
                 if child.tail and child.tail.strip():
-                    p = self._doc.create_fragment('<p/>')
+                    p = ctx.doc.create_fragment('<p/>')
                     p.text = child.tail
                     child.tail = None
                     el.insert(pos + 1, p)
                 if child.tag == 'br':
                     child.drop_tree()
+        ctx.reindex()
 
-    def _score_paragraphs(self):
+    def _score_paragraphs(self, ctx):
         min_len = self.config.get('body_minimum_length', 0)
-        scores  = self._scores
+        index   = ctx.index
+        scores  = ctx.scores
         ordered = []
-        for el in self._root.iterdescendants('p', 'pre'):
-            parent_el = el.getparent()
-            if parent_el is None:
-                continue
-            grand_parent_el = parent_el.getparent()
+        for pos in index.descendants(0, 'p', 'pre'):
+            parent = index.parents[pos]
+            grand_parent = index.parents[parent]
 
-            inner_text = _clean_text(el.text_content() or '')
+            inner_text = _clean_text(ctx.text(pos))
             inner_text_len = len(inner_text)
             if inner_text_len < min_len:
                 continue
 
-            if parent_el not in scores:
-                scores[parent_el] = _score_node(parent_el)
-                ordered.append(parent_el)
+            if parent not in scores:
+                scores[parent] = _score_node(index, parent)
+                ordered.append(parent)
 
-            if grand_parent_el is not None and grand_parent_el not in scores:
-                scores[grand_parent_el] = _score_node(grand_parent_el)
-                ordered.append(grand_parent_el)
+            if grand_parent >= 0 and grand_parent not in scores:
+                scores[grand_parent] = _score_node(index, grand_parent)
+                ordered.append(grand_parent)
 
             score = 1.0 + _score_text(inner_text) + min((inner_text_len / 100), 3)
-            scores[parent_el]['score'] += score
-            if grand_parent_el is not None:
-                scores[grand_parent_el]['score'] += score / 2.0
+            scores[parent]['score'] += score
+            if grand_parent >= 0:
+                scores[grand_parent]['score'] += score / 2.0
 
-        for el in ordered:
-            ld = _get_link_density(el)
-            scores[el]['link_density'] = ld
-            scores[el]['score'] *= 1 - ld
+        for pos in ordered:
+            ld = ctx.link_density(pos)
+            scores[pos]['link_density'] = ld
+            scores[pos]['score'] *= 1 - ld
 
-    def _reduce_candidates(self):
-        if not self._scores:
+    def _reduce_candidates(self, ctx):
+        if not ctx.scores:
             return []
-        scores = sorted([x for x in self._scores.values() if x['element'].get('x', '')],
+        index  = ctx.index
+        origin = ctx.origin
+        scores = sorted([x for x in ctx.scores.values() if origin[x['pos']] is not None],
                         key=lambda x:x['score'], reverse=True)
         reduced = []
         added = set()
         denial = set()
         for score in scores:
-            el = score['element']
-            if score['score'] < 15.0 or score['link_density'] > 0.33 or el in denial:
+            pos = score['pos']
+            if score['score'] < CANDIDATE_SCORE or score['link_density'] > 0.33 or pos in denial:
                 continue
-            if el.tag in ('html', 'head', 'body'):
+            if index.tag(pos) in ('html', 'head', 'body'):
                 continue
-            if any((x in added for x in el.iterancestors())):
+            if any((x in added for x in index.ancestors(pos))):
                 continue
             reduced.append(score)
-            added.add(el)
-            denial.add(el)
-            for ancestor in el.iterancestors():
-                denial.add(ancestor)
+            added.add(pos)
+            denial.add(pos)
+            denial.update(index.ancestors(pos))
         return reduced
 
-    def _collect_exclude_elements(self, element):
-        for el in element.iter("h1", "h2", "h3", "h4", "h5", "h6"):
-            if _class_weight(el) < 0 or _get_link_density(el) > 0.33:
-                self._excludes.add(el.get('x', u''))
+    def _collect_exclude_elements(self, ctx, element):
+        index    = ctx.index
+        origin   = ctx.origin
+        excludes = ctx.excludes
+        for pos in _iter_tags(index, element, ("h1", "h2", "h3", "h4", "h5", "h6")):
+            if _class_weight(index, pos) < 0 or ctx.link_density(pos) > 0.33:
+                excludes.add(origin[pos])
 
         min_len = self.config.get('body_minimum_length', 0)
-        done = self._done
-        scores = self._scores
-        for el in reversed(list(element.iter('table', 'ul', 'div', 'p'))):
-            if el in done:
+        done = ctx.done
+        scores = ctx.scores
+        for pos in reversed(_iter_tags(index, element, ('table', 'ul', 'div', 'p'))):
+            if pos in done:
                 continue
-            done.add(el)
+            done.add(pos)
 
-            weight = _class_weight(el)
-            score = scores[el]['score'] if el in scores else 0
-            tag = el.tag
+            weight = _class_weight(index, pos)
+            score = scores[pos]['score'] if pos in scores else 0
+            tag = index.tag(pos)
 
             if weight + score < 0:
-                self._excludes.add(el.get('x', u''))
-            elif _score_text(el.text_content() or u'') < 10:
+                excludes.add(origin[pos])
+            elif _score_text(ctx.text(pos)) < 10:
                 counts = {}
                 for kind in ('p', 'img', 'li', 'a', 'embed', 'input'):
-                    counts[kind] = len(el.findall('.//%s' % kind))
-                counts["input"] -= len(el.findall('.//input[@type="hidden"]'))
+                    counts[kind] = index.count(pos, kind)
+                counts["input"] -= len([x for x in index.descendants(pos, 'input')
+                                        if index.elements[x].get('type') == 'hidden'])
 
-                content_length = _get_text_length(el)
-                link_density = _get_link_density(el)
+                content_length = ctx.text_length(pos)
+                link_density = ctx.link_density(pos)
                 to_remove = False
                 if tag == 'ul' or tag == 'ol':
                     to_remove = counts['li'] == counts['a']
@@ -216,40 +367,38 @@ class BodyRemovalFilter(AbstractFilter):
                 if not to_remove and not content_length:
                     to_remove = True
                 if to_remove:
-                    el = next(el.iterancestors('a'), el)
-                    self._excludes.add(el.get('x', u''))
+                    a = index.find_ancestor(pos, 'a')
+                    excludes.add(origin[a if a >= 0 else pos])
             elif tag == 'ul' or tag == 'ol':
-                if len(el.findall('.//li')) == len(el.findall('.//a')):
-                    el = next(el.iterancestors('a'), el)
-                    self._excludes.add(el.get('x', u''))
+                if index.count(pos, 'li') == index.count(pos, 'a'):
+                    a = index.find_ancestor(pos, 'a')
+                    excludes.add(origin[a if a >= 0 else pos])
 
-        self._excludes.discard(u'')
+        excludes.discard(None)
 
-    def _collect_drop_paths(self, drop_list, element):
+    def _collect_drop_paths(self, ctx, drop_list, element):
         drop = True
         sub_list = []
-        excludes = self._excludes
-        for child in element:
-            path = child.get('x', '')
-            if not path:
+        origin = ctx.origin
+        excludes = ctx.excludes
+        for child in ctx.index.children(element):
+            path = origin[child]
+            if path is None:
                 continue
             if path in excludes:
                 drop = False
             else:
-                drop = self._collect_drop_paths(sub_list, child) and drop
-        path = element.get('x', '')
-        if drop and path:
+                drop = self._collect_drop_paths(ctx, sub_list, child) and drop
+        path = origin[element]
+        if drop and path is not None:
             drop_list.append(path)
         else:
             drop_list.extend(sub_list)
         return drop
 
     def _drop_text_elements(self, doc, drop_list):
-        tree = doc.tree
-        drop_elements = []
-        for path in drop_list:
-            el = tree.find(path)
-            if el is not None:
-                drop_elements.append(el)
-        for el in drop_elements:
+        # drop_list holds positions in the document's index; resolve them all before dropping.
+        elements = doc.index.elements
+        for el in [elements[x] for x in drop_list]:
             el.drop_tree()
+        doc.reset_index()
@@ -6,12 +6,29 @@ from .abstract import BaseComponent
 from .compat   import *
 
 import re
+import sys
 
 
-__all__ = ('PrintFormatter',)
+__all__ = ('PrintFormatter', 'RecordFormatter', 'StreamFormatter')
 
-SPACE_SUB = re.compile(r'[ \t]+').sub
-EOL_SUB   = re.compile(r'[\r\n]+').sub
+SPACE_SUB    = re.compile(r'[ \t]+').sub
+EOL_SUB      = re.compile(r'[\r\n]+').sub
+CSV_QUOTE    = re.compile(r'[",\r\n]').search
+CSV_COLUMNS  = ('page', 'rank', 'score', 'cbg_score', 'path', 'title', 'url', 'entry_score')
+
+
+def _clean_title(title):
+    return EOL_SUB("\n", SPACE_SUB(' ', title))
+
+
+def _csv_row(values):
+    rv = []
+    for value in values:
+        value = STR_TYPE(value)
+        if CSV_QUOTE(value):
+            value = '"%s"' % value.replace('"', '""')
+        rv.append(value)
+    return ','.join(rv) + '\r\n'
 
 
 class PrintFormatter(BaseComponent):
@@ -22,7 +39,106 @@ class PrintFormatter(BaseComponent):
                   (i + 1, len(group.entries), group.score, group.cbg_score,
                    ' > '.join(group.paths[0].path)))
             for entry in group.entries:
-                title = SPACE_SUB(' ', entry.title)
-                title = EOL_SUB("\n", title)
-                print("  %s : %.2f\n    %s" % (title, entry.score, entry.url))
+                print("  %s : %.2f\n    %s" % (_clean_title(entry.title), entry.score, entry.url))
         return None
+
+
+class RecordFormatter(BaseComponent):
+    """Returns the detected groups as a list of plain dicts (JSON serializable)."""
+
+    def run(self, doc, groups):
+        return [self.group_record(i + 1, group) for i, group in enumerate(groups)]
+
+    def group_record(self, rank, group):
+        return {
+            'rank':      rank,
+            'score':     group.score,
+            'cbg_score': group.cbg_score,
+            'path':      ' > '.join(group.paths[0].path),
+            'entries':   [self.entry_record(x) for x in group.entries],
+        }
+
+    def entry_record(self, entry):
+        return {
+            'title': _clean_title(entry.title),
+            'url':   entry.url,
+            'score': entry.score,
+        }
+
+
+class StreamFormatter(RecordFormatter):
+    """
+    Writes RecordFormatter records to a text `stream` (sys.stdout by default) as they are
+    built, one group at a time, and returns the number of groups written. `output_format` is
+    'jsonl' (a group record with the page url per line) or 'csv' (an entry per row, CSV_COLUMNS,
+    header first). Output is handed to the stream in chunks of about `buffer_size` characters,
+    so memory use doesn't grow with the size of the result; one formatter can be shared by
+    threads, records of different pages may interleave but are never split.
+    """
+
+    DEFAULT_CONFIG = {
+        'stream':        None,
+        'output_format': 'jsonl',
+        'buffer_size':   65536,
+        'csv_header':    True,
+    }
+
+    def __init__(self, config={}):
+        super(StreamFormatter, self).__init__(config)
+        if self.config['output_format'] not in ('jsonl', 'csv'):
+            raise ValueError('unknown output format: %s' % self.config['output_format'])
+        # json and threading are only loaded by the streaming formats
+        import json, threading
+        self._dumps       = json.dumps
+        self._lock        = threading.Lock()
+        self._header_done = not (self.config['output_format'] == 'csv' and
+                                 self.config['csv_header'])
+
+    def run(self, doc, groups):
+        return self.write_records(doc.url, (self.group_record(i + 1, group)
+                                            for i, group in enumerate(groups)))
+
+    def write_records(self, page, records):
+        """Streams group records (e.g. results of a FetchPipeline) of a page."""
+        buffer_size = self.config['buffer_size']
+        encode      = self._encode_csv if self.config['output_format'] == 'csv' else self._encode_json
+        chunk       = []
+        length      = 0
+        count       = 0
+        for record in records:
+            text = encode(page, record)
+            chunk.append(text)
+            length += len(text)
+            count  += 1
+            if length >= buffer_size:
+                self._write(chunk)
+                chunk  = []
+                length = 0
+        self._write(chunk, flush=True)
+        return count
+
+    def write_error(self, page, error):
+        """Reports a page that failed; a JSON line in jsonl output, stderr in csv output."""
+        if self.config['output_format'] == 'csv':
+            print('%s: %s' % (page, error), file=sys.stderr)
+        else:
+            self._write([self._dumps({'page': page, 'error': error}) + '\n'], flush=True)
+
+    def _encode_json(self, page, record):
+        return self._dumps(dict(record, page=page)) + '\n'
+
+    def _encode_csv(self, page, record):
+        head = (page or '', record['rank'], record['score'], record['cbg_score'], record['path'])
+        return ''.join([_csv_row(head + (x['title'], x['url'], x['score']))
+                        for x in record['entries']])
+
+    def _write(self, chunk, flush=False):
+        stream = self.config['stream'] or sys.stdout
+        with self._lock:
+            if not self._header_done:
+                stream.write(_csv_row(CSV_COLUMNS))
+                self._header_done = True
+            if chunk:
+                stream.write(''.join(chunk))
+            if flush:
+                stream.flush()
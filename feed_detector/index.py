@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import bisect
+
+from .classify import class_info
+
+
+__all__ = ('DomIndex',)
+
+
+class DomIndex(object):
+    """
+    Flattened pre-order view of an element tree. Element `pos` is described by the parallel
+    lists below, so ancestor and subtree queries are integer operations instead of walks through
+    lxml proxies: the subtree of `pos` is the range [pos, ends[pos]) and its ancestors are
+    reached by following `parents`. Tag names and class/id attribute values are interned; the
+    per element lists hold their ids, and class_infos/id_infos hold the classify.ClassInfo of
+    each interned value.
+
+    The index is a snapshot. Structural changes to the tree need a new index (see
+    Document.reset_index()); class and id changes should go through set_class()/remove_id().
+    """
+
+    def __init__(self, root):
+        from lxml.etree import Element
+        self.elements    = []
+        self.tags        = []
+        self.parents     = []
+        self.ends        = []
+        self.classes     = []
+        self.ids         = []
+        self.tag_names   = []
+        self.class_names = []
+        self.id_names    = []
+        self.class_infos = []
+        self.id_infos    = []
+        self._tag_ids    = {}
+        self._class_ids  = {}
+        self._id_ids     = {}
+        self._positions  = {}
+        self._labels     = {}
+        self._pos        = None
+        self._build(root, Element)
+
+    def __len__(self):
+        return len(self.elements)
+
+    def position(self, el):
+        """Returns the position of an element, or None if it isn't in the index."""
+        if self._pos is None:
+            self._pos = dict(zip(self.elements, range(len(self.elements))))
+        return self._pos.get(el)
+
+    def tag(self, pos):
+        return self.tag_names[self.tags[pos]]
+
+    def tag_id(self, tag):
+        """Interned id of a tag name, or None if no element has it."""
+        return self._tag_ids.get(tag)
+
+    def class_name(self, pos):
+        return self.class_names[self.classes[pos]]
+
+    def id_name(self, pos):
+        return self.id_names[self.ids[pos]]
+
+    def class_info(self, pos):
+        return self.class_infos[self.classes[pos]]
+
+    def id_info(self, pos):
+        return self.id_infos[self.ids[pos]]
+
+    def class_tokens(self, pos):
+        return self.class_info(pos).tokens
+
+    def set_class(self, pos, value):
+        self.elements[pos].set('class', value)
+        self.classes[pos] = self._intern(value, self.class_names, self._class_ids,
+                                         self.class_infos)
+        self._labels.clear()
+
+    def remove_id(self, pos):
+        del self.elements[pos].attrib['id']
+        self.ids[pos] = self._intern('', self.id_names, self._id_ids, self.id_infos)
+
+    def children(self, pos):
+        ends = self.ends
+        end  = ends[pos]
+        pos += 1
+        while pos < end:
+            yield pos
+            pos = ends[pos]
+
+    def ancestors(self, pos):
+        parents = self.parents
+        pos = parents[pos]
+        while pos >= 0:
+            yield pos
+            pos = parents[pos]
+
+    def find_ancestor(self, pos, tag):
+        """Returns the nearest ancestor with the tag, or -1."""
+        tid = self.tag_id(tag)
+        if tid is None:
+            return -1
+        tags = self.tags
+        for pos in self.ancestors(pos):
+            if tags[pos] == tid:
+                return pos
+        return -1
+
+    def positions(self, tag):
+        """Sorted positions of the elements with the tag."""
+        rv = self._positions.get(tag)
+        if rv is None:
+            tid = self.tag_id(tag)
+            rv = [i for i, x in enumerate(self.tags) if x == tid] if tid is not None else []
+            self._positions[tag] = rv
+        return rv
+
+    def descendants(self, pos, *tags):
+        """Sorted positions of the descendants of pos with any of the tags."""
+        end = self.ends[pos]
+        rv  = []
+        for tag in tags:
+            positions = self.positions(tag)
+            rv.extend(positions[bisect.bisect_right(positions, pos):
+                                bisect.bisect_left(positions, end)])
+        if len(tags) > 1:
+            rv.sort()
+        return rv
+
+    def count(self, pos, tag):
+        """Number of the descendants of pos with the tag."""
+        positions = self.positions(tag)
+        return (bisect.bisect_left(positions, self.ends[pos]) -
+                bisect.bisect_right(positions, pos))
+
+    def fullpath_prefix(self, pos):
+        """`tag.class1.class2>...` chain from the root down to pos, classes sorted."""
+        rv = self._labels.get(pos)
+        if rv is None:
+            classes = self.class_info(pos).label
+            label   = '%s.%s' % (self.tag(pos), classes) if classes else self.tag(pos)
+            parent = self.parents[pos]
+            rv = self._labels[pos] = (self.fullpath_prefix(parent) + '>' + label
+                                      if parent >= 0 else label)
+        return rv
+
+    def _intern(self, value, names, ids, infos=None):
+        i = ids.get(value)
+        if i is None:
+            i = ids[value] = len(names)
+            names.append(value)
+            if infos is not None:
+                infos.append(class_info(value))
+        return i
+
+    def _build(self, root, element_type):
+        elements  = self.elements
+        tags      = self.tags
+        parents   = self.parents
+        ends      = self.ends
+        classes   = self.classes
+        ids       = self.ids
+        intern    = self._intern
+        tag_args  = (self.tag_names, self._tag_ids)
+        cls_args  = (self.class_names, self._class_ids, self.class_infos)
+        id_args   = (self.id_names, self._id_ids, self.id_infos)
+        stack     = []
+        for pos, el in enumerate(root.iter(element_type)):
+            parent = el.getparent()
+            while stack and elements[stack[-1]] is not parent:
+                ends[stack.pop()] = pos
+            elements.append(el)
+            tags.append(intern(el.tag, *tag_args))
+            parents.append(stack[-1] if stack else -1)
+            ends.append(0)
+            classes.append(intern(el.get('class', ''), *cls_args))
+            ids.append(intern(el.get('id', ''), *id_args))
+            stack.append(pos)
+        for pos in stack:
+            ends[pos] = len(elements)
@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+
+"""
+Per stage profiling of coordinator runs.
+
+A StageProfiler keeps one cProfile profile per stage (parse, prepare, each filter, detect,
+format); profiles of every document run through it add up, so a corpus run is profiled as a
+whole. dump() writes `<stage>.pstats` files for pstats/snakeviz and `<stage>.collapsed`
+folded stacks for flamegraph.pl or speedscope; report() prints the hottest functions of
+every stage.
+"""
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import collections
+import os
+import sys
+import time
+
+from .coordinator import BaseCoordinator
+
+
+__all__ = ('StageProfiler', 'ProfilingMixin', 'ProfilingCoordinator')
+
+
+def _frame_name(func):
+    filename, line, name = func
+    if filename == '~':  # built-in functions
+        return name.replace(';', ':')
+    return ('%s (%s:%d)' % (name, os.path.basename(filename), line)).replace(';', ':')
+
+
+class StageProfiler(object):
+
+    def __init__(self):
+        self._profiles = collections.OrderedDict()
+        self._times    = collections.defaultdict(float)
+        self._runs     = collections.defaultdict(int)
+
+    @property
+    def stages(self):
+        return list(self._profiles)
+
+    def run(self, stage, f, *args, **kwargs):
+        """Calls f(*args, **kwargs) with the profile of `stage` enabled."""
+        profile = self._profiles.get(stage)
+        if profile is None:
+            import cProfile
+            profile = self._profiles[stage] = cProfile.Profile()
+        t = time.time()
+        profile.enable()
+        try:
+            return f(*args, **kwargs)
+        finally:
+            profile.disable()
+            self._times[stage] += time.time() - t
+            self._runs[stage]  += 1
+
+    def stats(self, stage):
+        import pstats
+        return pstats.Stats(self._profiles[stage])
+
+    def dump(self, out_dir):
+        """Writes <stage>.pstats and <stage>.collapsed of every stage; returns the paths."""
+        if not os.path.isdir(out_dir):
+            os.makedirs(out_dir)
+        rv = []
+        for stage in self._profiles:
+            name = stage.replace(':', '-')
+            path = os.path.join(out_dir, name + '.pstats')
+            self.stats(stage).dump_stats(path)
+            rv.append(path)
+            path = os.path.join(out_dir, name + '.collapsed')
+            with open(path, 'wt') as f:
+                for stack, usecs in self.collapsed(stage):
+                    f.write('%s;%s %d\n' % (stage, ';'.join(stack), usecs))
+            rv.append(path)
+        return rv
+
+    def collapsed(self, stage, min_usecs=1):
+        """
+        Folded stacks of a stage as (frames, microseconds of own time). cProfile only records
+        caller/callee pairs, so the time of a function is split between the stacks it was
+        called from in proportion to the time each caller spent in it; recursion is folded
+        into the outermost call.
+        """
+        stats    = self.stats(stage).stats
+        children = collections.defaultdict(list)
+        roots    = []
+        for func, (cc, nc, tt, ct, callers) in stats.items():
+            if not callers:
+                roots.append(func)
+            for caller, edge in callers.items():
+                children[caller].append((func, edge[3]))
+        rv = []
+
+        def walk(func, stack, share):
+            cc, nc, tt, ct, callers = stats[func]
+            stack.append(_frame_name(func))
+            usecs = int(tt * share * 1e6)
+            if usecs >= min_usecs:
+                rv.append((tuple(stack), usecs))
+            on_stack = set(stack)
+            for child, edge_ct in children.get(func, ()):
+                child_ct = stats[child][3]
+                if child_ct <= 0 or _frame_name(child) in on_stack:
+                    continue
+                child_share = share * min(edge_ct / child_ct, 1.0)
+                if child_ct * child_share * 1e6 >= min_usecs:
+                    walk(child, stack, child_share)
+            stack.pop()
+
+        for func in roots:
+            walk(func, [], 1.0)
+        return rv
+
+    def report(self, top=10, file=sys.stderr):
+        """Prints the run count, time and `top` functions by own time of every stage."""
+        for stage in self._profiles:
+            stats = self.stats(stage).stats
+            print('%s: %d runs, %.1f ms' % (stage, self._runs[stage], self._times[stage] * 1000),
+                  file=file)
+            print('  %10s %10s %9s  %s' % ('own ms', 'total ms', 'calls', 'function'), file=file)
+            rows = sorted(stats.items(), key=lambda x:x[1][2], reverse=True)[:top]
+            for func, (cc, nc, tt, ct, callers) in rows:
+                print('  %10.2f %10.2f %9d  %s' % (tt * 1000, ct * 1000, nc, _frame_name(func)),
+                      file=file)
+
+
+class ProfilingMixin(object):
+    """Coordinator mixin that runs every stage under config['profiler'], a StageProfiler."""
+
+    def prepare(self, doc):
+        return self.config['profiler'].run('prepare', super(ProfilingMixin, self).prepare, doc)
+
+    def apply_filter(self, doc, f):
+        return self.config['profiler'].run('filter:%s' % type(f).__name__,
+                                           super(ProfilingMixin, self).apply_filter, doc, f)
+
+    def detect(self, doc):
+        return self.config['profiler'].run('detect', super(ProfilingMixin, self).detect, doc)
+
+    def format(self, doc, groups):
+        return self.config['profiler'].run('format', super(ProfilingMixin, self).format,
+                                           doc, groups)
+
+
+class ProfilingCoordinator(ProfilingMixin, BaseCoordinator):
+    pass
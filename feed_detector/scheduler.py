@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+
+# Polling scheduler built on the asyncio fetch pipeline. Python 3 only.
+
+import asyncio
+import hashlib
+import json
+import os
+import time
+
+from .fetcher import FetchError, FetchPipeline
+
+
+__all__ = ('PageState', 'PollScheduler')
+
+
+class PageState(object):
+    """What the scheduler remembers about a watched page between polls."""
+
+    __slots__ = ('url', 'etag', 'last_modified', 'body_hash', 'interval', 'next_poll', 'entries')
+
+    def __init__(self, url, interval, next_poll=0.0):
+        self.url           = url
+        self.etag          = None
+        self.last_modified = None
+        self.body_hash     = None
+        self.interval      = interval
+        self.next_poll     = next_poll
+        self.entries       = None  # entry urls detected by the last successful poll
+
+    def to_dict(self):
+        rv = dict([(x, getattr(self, x)) for x in self.__slots__])
+        if self.entries is not None:
+            rv['entries'] = sorted(self.entries)
+        return rv
+
+    @classmethod
+    def from_dict(cls, d):
+        page = cls(d['url'], d['interval'], d.get('next_poll', 0.0))
+        for name in ('etag', 'last_modified', 'body_hash'):
+            setattr(page, name, d.get(name))
+        if d.get('entries') is not None:
+            page.entries = set(d['entries'])
+        return page
+
+
+class PollScheduler(FetchPipeline):
+    """
+    Polls watched pages with conditional requests and emits only the entries that were not
+    detected by the previous poll, or by any earlier poll if a `seen_store` (a seen.SeenStore)
+    is given. Detection is skipped on 304 responses and when the body is byte-identical to the
+    last one. Each page's interval shrinks by `speedup` when its entries change and grows by
+    `backoff` when they don't, within [min_interval, max_interval] seconds.
+    """
+
+    DEFAULT_CONFIG = dict(FetchPipeline.DEFAULT_CONFIG, **{
+        'initial_interval': 3600.0,
+        'min_interval':     300.0,
+        'max_interval':     86400.0,
+        'speedup':          0.5,
+        'backoff':          1.5,
+    })
+
+    def __init__(self, urls=(), config={}, seen_store=None):
+        super(PollScheduler, self).__init__(config)
+        self._seen  = seen_store
+        self._pages = {}
+        for url in urls:
+            self.add(url)
+
+    @property
+    def pages(self):
+        return self._pages
+
+    def add(self, url):
+        if url not in self._pages:
+            self._pages[url] = PageState(url, self.config['initial_interval'])
+        return self._pages[url]
+
+    def load(self, path):
+        with open(path, 'rt') as f:
+            for d in json.load(f):
+                self._pages[d['url']] = PageState.from_dict(d)
+
+    def save(self, path):
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wt') as f:
+            json.dump([x.to_dict() for x in self._pages.values()], f)
+        os.rename(tmp_path, path)
+
+    def next_poll(self):
+        return min([x.next_poll for x in self._pages.values()] or [None])
+
+    async def poll_due(self, now=None):
+        """Polls every page that is due. Returns a list of (url, new entries, error)."""
+        now = time.time() if now is None else now
+        due = [x for x in self._pages.values() if x.next_poll <= now]
+        return await asyncio.gather(*[self.poll(x, now) for x in due])
+
+    async def poll(self, page, now):
+        try:
+            new_entries = await self._poll(page)
+        except Exception as e:
+            page.next_poll = now + page.interval
+            return page.url, [], '%s: %s' % (type(e).__name__, e)
+        config = self.config
+        if new_entries:
+            page.interval = max(config['min_interval'], page.interval * config['speedup'])
+        else:
+            page.interval = min(config['max_interval'], page.interval * config['backoff'])
+        page.next_poll = now + page.interval
+        return page.url, new_entries, None
+
+    async def run_forever(self, callback, state_path=None):
+        """
+        Calls callback(url, new_entries, error) for every poll until cancelled. New seen keys
+        are synced to the store's log after every cycle, merged when its flush_threshold is
+        reached and on exit.
+        """
+        self.open()
+        try:
+            while True:
+                for url, new_entries, error in await self.poll_due():
+                    if new_entries or error:
+                        callback(url, new_entries, error)
+                # polls of a host are usually far apart; don't keep their sockets open
+                self._fetcher.evict_idle()
+                # the seen keys go to disk before the state that says their pages were polled
+                if self._seen is not None:
+                    self._seen.sync()
+                if state_path:
+                    self.save(state_path)
+                delay = (self.next_poll() or time.time() + 60.0) - time.time()
+                await asyncio.sleep(min(max(delay, 1.0), 60.0))
+        finally:
+            self.close()
+            if self._seen is not None:
+                self._seen.close()
+
+    async def _poll(self, page):
+        headers = {}
+        if page.etag:
+            headers['If-None-Match'] = page.etag
+        if page.last_modified:
+            headers['If-Modified-Since'] = page.last_modified
+        response = await self._fetcher.fetch(page.url, headers)
+        if response.status == 304:
+            return []
+        if response.status != 200:
+            raise FetchError('HTTP status %d' % response.status)
+        page.etag          = response.headers.get('etag')
+        page.last_modified = response.headers.get('last-modified')
+        body_hash = hashlib.sha1(response.body).hexdigest()
+        if body_hash == page.body_hash:
+            return []
+        groups = await self.detect_body(response.body, response.url)
+        page.body_hash = body_hash
+        return self._new_entries(page, groups)
+
+    def _new_entries(self, page, groups):
+        if self._seen is not None:
+            return [dict(entry, group=group['path'])
+                    for group in self._seen.filter_groups(page.url, groups)
+                    for entry in group['entries']]
+        seen    = page.entries or set()
+        current = set()
+        rv      = []
+        for group in groups:
+            for entry in group['entries']:
+                url = entry['url']
+                if url not in current:
+                    current.add(url)
+                    if url not in seen:
+                        rv.append(dict(entry, group=group['path']))
+        page.entries = current
+        return rv
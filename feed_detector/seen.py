@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+
+# Compact store of already emitted entries. Python 3 only.
+
+import array
+import bisect
+import hashlib
+import heapq
+import mmap
+import os
+import struct
+
+
+__all__ = ('SeenStore',)
+
+
+HASH_SIZE = 8
+
+
+class SeenStore(object):
+    """
+    Set of 64 bit hashes of (page, group path, entry url) keys. Flushed hashes are kept in a
+    sorted array of fixed-width integers; with a `path` the array lives in a file that is
+    memory mapped, so membership tests are binary searches over the page cache and a watch
+    list costs 8 bytes per entry on disk and next to nothing on the heap. Hashes added since
+    the last flush are held in a set and merged into the array by flush(), which rewrites the
+    file; sync() only appends them to `<path>.log`, which is read back on open and emptied by
+    the next flush().
+    """
+
+    def __init__(self, path=None, include_title=False, flush_threshold=65536):
+        self._path            = path
+        self._include_title   = include_title
+        self._flush_threshold = flush_threshold
+        self._pending         = set()
+        self._unlogged        = array.array('Q')  # pending hashes not in the log yet
+        self._file            = None
+        self._mmap            = None
+        self._hashes          = array.array('Q')
+        if path:
+            self._open()
+
+    def __len__(self):
+        return len(self._hashes) + len(self._pending)
+
+    def __contains__(self, h):
+        if h in self._pending:
+            return True
+        hashes = self._hashes
+        i = bisect.bisect_left(hashes, h)
+        return i < len(hashes) and hashes[i] == h
+
+    def key(self, page, group, url, title=''):
+        s = '\0'.join((page or '', group, url, title if self._include_title else ''))
+        return struct.unpack('<Q', hashlib.blake2b(s.encode('utf-8'),
+                                                   digest_size=HASH_SIZE).digest())[0]
+
+    def add(self, h):
+        """Adds a hash and returns True if it wasn't in the store."""
+        if h in self:
+            return False
+        self._pending.add(h)
+        self._unlogged.append(h)
+        if len(self._pending) >= self._flush_threshold:
+            self.flush()
+        return True
+
+    def filter_groups(self, page, groups):
+        """
+        Takes RecordFormatter group records, marks their entries as seen and returns copies of
+        the groups that only contain unseen entries. Groups left empty are dropped.
+        """
+        rv = []
+        for group in groups:
+            path    = group['path']
+            entries = [x for x in group['entries']
+                       if self.add(self.key(page, path, x['url'], x['title']))]
+            if entries:
+                rv.append(dict(group, entries=entries))
+        return rv
+
+    def sync(self):
+        """Makes the hashes added since the last sync durable by appending them to the log."""
+        if self._path and self._unlogged:
+            with open(self._log_path, 'ab') as f:
+                self._unlogged.tofile(f)
+                f.flush()
+                os.fsync(f.fileno())
+        self._unlogged = array.array('Q')
+
+    def flush(self):
+        if not self._pending:
+            return
+        pending = sorted(self._pending)
+        if self._path:
+            self._merge_file(pending)
+            if os.path.exists(self._log_path):
+                os.remove(self._log_path)
+        else:
+            merged = array.array('Q', heapq.merge(self._hashes, pending))
+            self._hashes = merged
+        self._pending  = set()
+        self._unlogged = array.array('Q')
+
+    def close(self):
+        self.flush()
+        self._unmap()
+
+    @property
+    def _log_path(self):
+        return self._path + '.log'
+
+    def _open(self):
+        self._map()
+        if os.path.exists(self._log_path):
+            self._read_log()
+
+    def _read_log(self):
+        logged = array.array('Q')
+        with open(self._log_path, 'rb') as f:
+            data = f.read()
+        # a write cut short by a crash leaves a partial hash at the end
+        logged.frombytes(data[:len(data) - len(data) % HASH_SIZE])
+        self._pending.update([x for x in logged if x not in self])
+
+    def _map(self):
+        if not os.path.exists(self._path):
+            open(self._path, 'wb').close()
+        self._file = open(self._path, 'rb')
+        size = os.fstat(self._file.fileno()).st_size
+        if size % HASH_SIZE:
+            raise ValueError('corrupt seen store: %s' % self._path)
+        if size:
+            self._mmap   = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            self._hashes = memoryview(self._mmap).cast('Q')
+        else:
+            self._hashes = array.array('Q')
+
+    def _unmap(self):
+        if isinstance(self._hashes, memoryview):
+            self._hashes.release()
+        self._hashes = array.array('Q')
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _merge_file(self, pending):
+        tmp_path = self._path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            buf = array.array('Q')
+            for h in heapq.merge(self._hashes, pending):
+                buf.append(h)
+                if len(buf) >= 8192:
+                    buf.tofile(f)
+                    buf = array.array('Q')
+            buf.tofile(f)
+        self._unmap()
+        os.replace(tmp_path, self._path)
+        self._map()
@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import collections
+import json
+import multiprocessing
+import os
+import sys
+import threading
+import time
+
+if sys.version_info[0] == 3:
+    from http.server  import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn, UnixStreamServer
+    from urllib.parse import parse_qs, urlsplit
+else:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer   import ThreadingMixIn, UnixStreamServer
+    from urlparse       import parse_qs, urlsplit
+
+from .abstract import BaseComponent
+from .worker   import worker_config, init_worker, detect_with_stats
+
+
+__all__ = ('ServerStats', 'DetectionServer')
+
+
+class ServerStats(object):
+    """Request counters and a sliding window of latencies, shared by handler threads."""
+
+    PERCENTILES = (50, 90, 99)
+
+    def __init__(self, window=1024):
+        self._lock      = threading.Lock()
+        self._latencies = collections.deque(maxlen=window)
+        self._started   = time.time()
+        self._templates = {}  # latest template cache counters of each worker pid
+        self.requests   = 0
+        self.errors     = 0
+        self.pending    = 0
+
+    def begin(self):
+        with self._lock:
+            self.requests += 1
+            self.pending  += 1
+
+    def end(self, elapsed, error=False):
+        with self._lock:
+            self.pending -= 1
+            if error:
+                self.errors += 1
+            else:
+                self._latencies.append(elapsed)
+
+    def worker_templates(self, pid, snapshot):
+        if snapshot is not None:
+            with self._lock:
+                self._templates[pid] = snapshot
+
+    def snapshot(self):
+        with self._lock:
+            latencies = sorted(self._latencies)
+            rv = {
+                'uptime':      time.time() - self._started,
+                'requests':    self.requests,
+                'errors':      self.errors,
+                'queue_depth': self.pending,
+            }
+            if self._templates:
+                # Every worker has a cache of its own, so a layout only hits in the workers
+                # that have seen it. Lookups add up; hosts and templates are per worker.
+                rv['template_cache'] = dict(
+                    [(k, sum([x[k] for x in self._templates.values()]))
+                     for k in ('hits', 'misses', 'rejects')],
+                    workers=dict([(str(k), v) for k, v in self._templates.items()]))
+        for p in self.PERCENTILES:
+            key = 'latency_p%d' % p
+            if latencies:
+                rv[key] = latencies[min(len(latencies) - 1, len(latencies) * p // 100)]
+            else:
+                rv[key] = None
+        return rv
+
+
+class DetectionRequestHandler(BaseHTTPRequestHandler):
+    """
+    POST /detect?url=<document url>  Request body is the raw html bytes.
+    GET  /stats                      Request counters, queue depth, latency percentiles and
+                                     the template cache lookups, in total and per worker.
+    """
+
+    def do_GET(self):
+        if urlsplit(self.path).path == '/stats':
+            self._send_json(200, self.server.stats.snapshot())
+        else:
+            self._send_json(404, {'error': 'not found'})
+
+    def do_POST(self):
+        parts = urlsplit(self.path)
+        if parts.path != '/detect':
+            self._send_json(404, {'error': 'not found'})
+            return
+        length = self.headers.get('Content-Length')
+        if length is None:
+            self._send_json(411, {'error': 'Content-Length is required'})
+            return
+        try:
+            length = int(length)
+        except ValueError:
+            length = -1
+        if length < 0:
+            self._send_json(400, {'error': 'malformed Content-Length'})
+            return
+        if length == 0:
+            self._send_json(400, {'error': 'empty body'})
+            return
+        if length > self.server.max_body_size:
+            self._send_json(413, {'error': 'document is too large'})
+            return
+        source = self.rfile.read(length)
+        url    = (parse_qs(parts.query).get('url') or [None])[0]
+        status, result = self.server.detect(source, url)
+        self._send_json(status, result)
+
+    def address_string(self):
+        # client_address is an empty string on unix domain sockets.
+        return self.client_address[0] if self.client_address else 'unix'
+
+    def log_message(self, format, *args):
+        if not self.server.quiet:
+            BaseHTTPRequestHandler.log_message(self, format, *args)
+
+    def _send_json(self, status, obj):
+        body = json.dumps(obj).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class DetectionServer(BaseComponent):
+    """
+    Long running detection service. Documents are parsed and detected by a pool of worker
+    processes, each of which keeps a warm coordinator across requests.
+    """
+
+    DEFAULT_CONFIG = {
+        'workers':       None,   # defaults to the number of cpus
+        'timeout':       30.0,
+        'max_body_size': 16 * 1024 * 1024,
+        'quiet':         False,
+    }
+
+    def __init__(self, config={}):
+        super(DetectionServer, self).__init__(config)
+        self.stats = ServerStats()
+        self._coordinator_config = worker_config(self.config)
+        self._pool = None
+
+    def detect(self, source, url):
+        stats = self.stats
+        stats.begin()
+        t = time.time()
+        try:
+            groups, pid, templates = self._pool.apply_async(
+                detect_with_stats, (source, url)).get(self.config['timeout'])
+        except multiprocessing.TimeoutError:
+            stats.end(time.time() - t, error=True)
+            return 504, {'error': 'detection timed out'}
+        except Exception as e:
+            stats.end(time.time() - t, error=True)
+            return 500, {'error': '%s: %s' % (type(e).__name__, e)}
+        elapsed = time.time() - t
+        stats.end(elapsed)
+        stats.worker_templates(pid, templates)
+        return 200, {'url': url, 'elapsed': elapsed, 'groups': groups}
+
+    def serve(self, address=None, unix_socket=None):
+        if unix_socket:
+            if os.path.exists(unix_socket):
+                os.unlink(unix_socket)
+            httpd = _UnixHTTPServer(unix_socket, DetectionRequestHandler)
+        else:
+            httpd = _ThreadingHTTPServer(address or ('127.0.0.1', 8080), DetectionRequestHandler)
+        httpd.stats         = self.stats
+        httpd.detect        = self.detect
+        httpd.max_body_size = self.config['max_body_size']
+        httpd.quiet         = self.config['quiet']
+        self._pool = multiprocessing.Pool(self.config['workers'], init_worker,
+                                          (self._coordinator_config,))
+        try:
+            httpd.serve_forever()
+        finally:
+            httpd.server_close()
+            self._pool.terminate()
+            self._pool.join()
+            self._pool = None
+            if unix_socket and os.path.exists(unix_socket):
+                os.unlink(unix_socket)
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class _UnixHTTPServer(ThreadingMixIn, UnixStreamServer):
+    daemon_threads = True
@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+
+"""
+Scoring parameter sweep over a labelled corpus.
+
+    python -m feed_detector.sweep -l labels.jsonl -g grid.json [-t 1] [-n 20]
+
+Every line of the labels file is a page: `{"path": "page.html", "url": "http://...",
+"entries": ["http://...", ...]}` with the urls of the entries that should be detected (paths
+are relative to the labels file). The grid file maps Scoring parameters to lists of values,
+e.g. `{"link": [1, 2, 3], "small_group": [3, 4, 5]}`; every combination is evaluated. Pages
+are parsed, filtered and grouped once; each parameter set only rescores the groups and runs
+the optimizer again. Results are printed as JSON lines, best F1 first.
+"""
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import itertools
+import json
+import os
+import sys
+
+from optparse import OptionParser
+
+from .abstract import BaseComponent
+from .detector import DEFAULT_SCORING, Detector, Scoring
+from .document import Document
+from .filter   import BodyRemovalFilter
+
+
+__all__ = ('PreparedPage', 'Sweep', 'scoring_grid')
+
+
+def scoring_grid(grid):
+    """Returns a Scoring for every combination of the parameter values in `grid`."""
+    names = sorted(grid)
+    return [Scoring(**dict(zip(names, values)))
+            for values in itertools.product(*[grid[x] for x in names])]
+
+
+class PreparedPage(object):
+    """A labelled page, filtered and grouped once and then evaluated under any Scoring."""
+
+    def __init__(self, doc, labels, config={}):
+        doc      = doc.copy()
+        detector = Detector(dict(config, scoring=DEFAULT_SCORING))
+        detector.prepare(doc)
+        for f in config.get('filters') or [BodyRemovalFilter]:
+            f = f(config)
+            f.run(doc)
+            if not getattr(f, 'index_aware', False):
+                doc.reset_index()
+        self.url        = doc.url
+        self.labels     = frozenset(labels)
+        self._optimizer = detector.build(doc)
+
+    def evaluate(self, scoring, top_groups=1):
+        """Returns (true positives, detected urls, labelled urls) of the best `top_groups`."""
+        self._optimizer.rescore(scoring)
+        detected = set()
+        for group in self._optimizer.optimize()[:top_groups]:
+            detected.update(group.url_set)
+        return len(detected & self.labels), len(detected), len(self.labels)
+
+
+class Sweep(BaseComponent):
+    """
+    Evaluates parameter sets on prepared pages. Precision and recall are micro averaged over
+    the pages: entries detected in the best `top_groups` groups against the labelled ones.
+    """
+
+    DEFAULT_CONFIG = {
+        'top_groups': 1,
+    }
+
+    def __init__(self, pages, config={}):
+        super(Sweep, self).__init__(config)
+        self.pages = pages
+
+    def evaluate(self, scoring):
+        top_groups = self.config['top_groups']
+        tp = detected = labelled = 0
+        for page in self.pages:
+            a, b, c = page.evaluate(scoring, top_groups)
+            tp       += a
+            detected += b
+            labelled += c
+        precision = tp / detected if detected else 0.0
+        recall    = tp / labelled if labelled else 0.0
+        f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+        return {
+            'params':    scoring.to_dict(),
+            'precision': precision,
+            'recall':    recall,
+            'f1':        f1,
+        }
+
+    def run(self, scorings):
+        """Returns the results of every Scoring, best F1 first."""
+        return sorted([self.evaluate(x) for x in scorings],
+                      key=lambda x:(x['f1'], x['precision']), reverse=True)
+
+
+def load_pages(labels_path, config={}):
+    base  = os.path.dirname(os.path.abspath(labels_path))
+    pages = []
+    with open(labels_path, 'rt') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            label = json.loads(line)
+            path  = os.path.join(base, label['path'])
+            with open(path, 'rb') as html:
+                doc = Document(html.read(), url=label.get('url') or 'file://%s' % path)
+            pages.append(PreparedPage(doc, label['entries'], config))
+    return pages
+
+
+def main():
+    parser = OptionParser(usage="%prog: -l <labels.jsonl> -g <grid.json> [options]")
+    parser.add_option('-l', '--labels', default=None, help="Labelled pages (JSON lines)")
+    parser.add_option('-g', '--grid', default=None,
+                      help="Parameter grid (JSON); only the defaults without it")
+    parser.add_option('-t', '--top-groups', type='int', default=1,
+                      help="Groups counted as detected [%default]")
+    parser.add_option('-n', '--limit', type='int', default=0,
+                      help="Results to print, 0 for all [%default]")
+    options, args = parser.parse_args()
+    if not options.labels:
+        parser.print_help()
+        sys.exit(1)
+
+    grid = {}
+    if options.grid:
+        with open(options.grid, 'rt') as f:
+            grid = json.load(f)
+    scorings = scoring_grid(grid)
+    pages    = load_pages(options.labels)
+    results  = Sweep(pages, {'top_groups': options.top_groups}).run(scorings)
+    for result in results[:options.limit or None]:
+        print(json.dumps(result, sort_keys=True))
+
+
+if __name__ == '__main__':
+    main()
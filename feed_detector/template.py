@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import collections
+import hashlib
+import sys
+import threading
+
+if sys.version_info[0] == 3:
+    from urllib.parse import urlsplit
+else:
+    from urlparse import urlsplit
+
+from .compat import *
+
+
+__all__ = ('page_host', 'page_signature', 'hamming_distance', 'TemplateCache')
+
+
+BYTE_BITS = [tuple([i for i in range(8) if value >> i & 1]) for value in range(256)]
+
+
+def page_host(url):
+    return urlsplit(url).netloc.lower() if url else ''
+
+
+def page_signature(index):
+    """
+    64 bit SimHash of a DomIndex over the multiset of the `tag.classes>...` chains of its
+    elements. Pages built from one template differ in a few bits at most, however different
+    their texts, links and numbers of list items are.
+    """
+    counts = collections.defaultdict(int)
+    for pos in xrange(len(index)):
+        counts[index.fullpath_prefix(pos)] += 1
+    # Counts are summed per byte value of the hashes first, then spread over the bits.
+    tables = [collections.defaultdict(int) for i in xrange(8)]
+    for chain, count in iteritems(counts):
+        digest = bytearray(hashlib.md5(chain.encode('utf-8')).digest()[:8])
+        for table, value in zip(tables, digest):
+            table[value] += count
+    weights = [0] * 64
+    for i, table in enumerate(tables):
+        for value, count in iteritems(table):
+            for bit in BYTE_BITS[value]:
+                weights[i * 8 + bit] += count
+    total = sum(itervalues(counts))
+    rv = 0
+    for i, weight in enumerate(weights):
+        if weight * 2 > total:
+            rv |= 1 << i
+    return rv
+
+
+def hamming_distance(a, b):
+    return bin(a ^ b).count('1')
+
+
+class TemplateCache(object):
+    """
+    Winning group paths of earlier detections, keyed by host and page signature. get() returns
+    the entry of the nearest signature of the host within `max_distance` bits. Up to `per_host`
+    signatures are kept for each of the `max_hosts` most recently used hosts.
+    """
+
+    def __init__(self, max_distance=6, per_host=16, max_hosts=1024):
+        self.max_distance = max_distance
+        self.per_host     = per_host
+        self.max_hosts    = max_hosts
+        self.hits         = 0
+        self.misses       = 0
+        self.rejects      = 0  # hits whose paths didn't validate on the page
+        self._lock        = threading.Lock()
+        self._hosts       = collections.OrderedDict()
+
+    def get(self, host, signature):
+        with self._lock:
+            templates = self._hosts.get(host)
+            rv = None
+            if templates is not None:
+                self._touch(self._hosts, host, templates)
+                rv = templates.get(signature)
+                if not rv:
+                    best = self.max_distance + 1
+                    for k, v in iteritems(templates):
+                        d = hamming_distance(k, signature)
+                        if d < best and v:
+                            best, rv = d, v
+            if not rv:
+                rv = None
+                self.misses += 1
+            else:
+                self.hits += 1
+            return rv
+
+    def put(self, host, signature, groups):
+        """
+        `groups` is a list of the Path.path tuples of each winning group. Empty templates
+        are never returned by get().
+        """
+        with self._lock:
+            templates = self._hosts.get(host)
+            if templates is None:
+                templates = collections.OrderedDict()
+                while len(self._hosts) >= self.max_hosts:
+                    self._hosts.popitem(last=False)
+            self._touch(self._hosts, host, templates)
+            self._touch(templates, signature, groups)
+            while len(templates) > self.per_host:
+                templates.popitem(last=False)
+
+    def reject(self):
+        with self._lock:
+            self.hits    -= 1
+            self.misses  += 1
+            self.rejects += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'hosts':     len(self._hosts),
+                'templates': sum([len(x) for x in self._hosts.values()]),
+                'hits':      self.hits,
+                'misses':    self.misses,
+                'rejects':   self.rejects,
+            }
+
+    def _touch(self, d, key, value):
+        d.pop(key, None)
+        d[key] = value
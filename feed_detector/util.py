@@ -3,11 +3,21 @@
 from __future__ import absolute_import, division, print_function, unicode_literals
 
 import re
+import sys
 
-__all__ = ('LINK_MATCH', 'is_valid_url')
+if sys.version_info[0] == 3:
+    from urllib.parse import urljoin, urlsplit
+else:
+    from urlparse import urljoin, urlsplit
+
+__all__ = ('LINK_MATCH', 'is_valid_url', 'UrlResolver')
 
 
 LINK_MATCH = re.compile(r'\s*https?://', re.I).match
+SCHEME_MATCH = re.compile(r'\s*[a-z][-+.a-z0-9]*:', re.I).match
+# hrefs that urljoin() would return as base prefix + href, i.e. without any normalization.
+PLAIN_PATH_MATCH = re.compile(r'/(?!/)(?:[^./?#;\s\\]|\.(?![./?#]|\Z)|/(?!\.))*'
+                              r'(?:\?[^#\s\\]*[^#?\s\\])?(?:#[^\s\\]*[^#\s\\])?\Z').match
 DENY_MATCH = re.compile(r'adclick\.g\.doubleclick\.net/'
                         r'|googleads\.g\.doubleclick\.net/'
                         r'|rd\.ane\.yahoo\.co\.jp/'
@@ -33,3 +43,45 @@ DENY_MATCH = re.compile(r'adclick\.g\.doubleclick\.net/'
 def is_valid_url(s):
     m = LINK_MATCH(s)
     return m and not DENY_MATCH(s, m.end())
+
+
+class UrlResolver(object):
+    """
+    Resolves hrefs against a document's base url on demand, so only the links that become
+    entries are ever joined. Results are memoized per href since pages repeat links a lot.
+    """
+
+    def __init__(self, base):
+        self.base     = base
+        self._is_http = bool(base and LINK_MATCH(base))
+        self._cache   = {}
+        self._root    = None
+        if self._is_http:
+            parts = urlsplit(base.strip())
+            self._root = '%s://%s' % (parts.scheme, parts.netloc)
+
+    def is_link(self, href):
+        """
+        Cheap test of whether href resolves to a http(s) url. Empty hrefs are rejected; that
+        is also what the cleaner leaves of javascript: links.
+        """
+        if not href or LINK_MATCH(href):
+            return bool(href)
+        return self._is_http and not SCHEME_MATCH(href) and bool(href.strip())
+
+    def __call__(self, href):
+        href = href.strip()
+        if not self.base or LINK_MATCH(href):
+            return href
+        url = self._cache.get(href)
+        if url is None:
+            if self._root and PLAIN_PATH_MATCH(href):
+                # root relative paths are by far the most common; skip reparsing the base.
+                url = self._root + href
+            else:
+                try:
+                    url = urljoin(self.base, href)
+                except ValueError:
+                    url = u''
+            self._cache[href] = url
+        return url
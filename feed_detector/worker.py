@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import os
+
+from .coordinator import BaseCoordinator
+from .document    import Document
+from .filter      import BodyRemovalFilter
+from .formatter   import RecordFormatter
+
+
+__all__ = ('worker_config', 'init_worker', 'detect', 'template_stats', 'detect_with_stats')
+
+
+# Coordinator of the current worker process, created once by init_worker() and reused for
+# every document the process handles.
+_coordinator = None
+
+
+def worker_config(config):
+    """Fills in the components a worker coordinator needs to return picklable results."""
+    return dict(config,
+                filters=config.get('filters') or [BodyRemovalFilter],
+                formatter=config.get('formatter') or RecordFormatter)
+
+def init_worker(config):
+    global _coordinator
+    _coordinator = BaseCoordinator(config)
+
+def detect(source, url):
+    return _coordinator.run(Document(source, url=url))
+
+def template_stats():
+    """TemplateCache counters of the current worker process, None without the cache."""
+    templates = _coordinator.detector.templates
+    return templates.snapshot() if templates is not None else None
+
+def detect_with_stats(source, url):
+    """detect(), along with the pid and template_stats() of the worker process."""
+    return detect(source, url), os.getpid(), template_stats()
@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import unittest
+
+from feed_detector.abstract    import AbstractFilter
+from feed_detector.coordinator import BaseCoordinator
+from feed_detector.detector    import DEFAULT_SCORING
+from feed_detector.document    import Document
+from feed_detector.formatter   import RecordFormatter
+from feed_detector.sweep       import PreparedPage
+
+
+def _list(cls, prefix):
+    return ('<ul class="%s">%s</ul>' %
+            (cls, ''.join(['<li><a href="/%s/%d">%s entry number %d</a></li>' %
+                           (prefix, i, prefix, i) for i in range(8)])))
+
+PAGE = ('<html><body><div id="drop">%s</div><div id="keep">%s</div></body></html>' %
+        (_list('d', 'd'), _list('k', 'k')))
+
+
+class DropFilter(AbstractFilter):
+
+    def run(self, doc):
+        for el in doc.index.elements:
+            if el.get('id') == 'drop':
+                el.drop_tree()
+                break
+
+
+class FilterIndexTest(unittest.TestCase):
+
+    def test_custom_filter_reindexes(self):
+        coordinator = BaseCoordinator({'filters': [DropFilter], 'formatter': RecordFormatter})
+        groups = coordinator.run(Document(PAGE, url='http://example.com/'))
+        self.assertEqual(set([x['url'].split('/')[3] for g in groups for x in g['entries']]),
+                         set(['k']))
+
+    def test_sweep_reindexes(self):
+        page = PreparedPage(Document(PAGE, url='http://example.com/'),
+                            ['http://example.com/d/0'], {'filters': [DropFilter]})
+        self.assertEqual(page.evaluate(DEFAULT_SCORING, top_groups=2)[0], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+
+# Tests of the asyncio fetcher against a local http.server. Python 3 only.
+
+import asyncio
+import os
+import threading
+import time
+import unittest
+
+from http.server  import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+from feed_detector.fetcher import AsyncFetcher, FetchError, FetchPipeline
+
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        BaseHTTPRequestHandler.setup(self)
+        with self.server.lock:
+            self.server.connections += 1
+
+    def do_GET(self):
+        if self.path == '/redirect':
+            self.send_body(302, b'', [('Location', '/index.html')])
+        elif self.path == '/redirect-loop':
+            self.send_body(302, b'', [('Location', '/redirect-loop')])
+        elif self.path == '/chunked':
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/html')
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.end_headers()
+            for chunk in (b'<html><body>', b'chunked', b'</body></html>'):
+                self.wfile.write(b'%x\r\n%s\r\n' % (len(chunk), chunk))
+            self.wfile.write(b'0\r\n\r\n')
+        elif self.path == '/big':
+            self.send_body(200, b'x' * 4096)
+        elif self.path == '/slow':
+            time.sleep(1.0)
+            self.send_body(200, b'slow')
+        else:
+            path = os.path.join(FIXTURES, self.path.lstrip('/'))
+            if not os.path.isfile(path):
+                self.send_body(404, b'not found')
+                return
+            with open(path, 'rb') as f:
+                self.send_body(200, f.read())
+
+    def send_body(self, status, body, headers=()):
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/html')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class FetcherTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = _Server(('127.0.0.1', 0), _Handler)
+        cls.server.lock        = threading.Lock()
+        cls.server.connections = 0
+        cls.base = 'http://127.0.0.1:%d' % cls.server.server_address[1]
+        cls.thread = threading.Thread(target=cls.server.serve_forever)
+        cls.thread.daemon = True
+        cls.thread.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def fetch(self, paths, **config):
+        async def run():
+            fetcher = AsyncFetcher(config)
+            try:
+                return [await fetcher.fetch(self.base + x) for x in paths]
+            finally:
+                fetcher.close()
+        return asyncio.run(run())
+
+    def fixture(self, name):
+        with open(os.path.join(FIXTURES, name), 'rb') as f:
+            return f.read()
+
+    def test_keep_alive(self):
+        connections = self.server.connections
+        responses = self.fetch(['/index.html'] * 3)
+        self.assertEqual([x.status for x in responses], [200] * 3)
+        self.assertEqual(responses[0].body, self.fixture('index.html'))
+        self.assertEqual(self.server.connections - connections, 1)
+
+    def test_redirect(self):
+        response, = self.fetch(['/redirect'])
+        self.assertEqual(response.status, 200)
+        self.assertEqual(response.url, self.base + '/index.html')
+        self.assertEqual(response.body, self.fixture('index.html'))
+        with self.assertRaises(FetchError):
+            self.fetch(['/redirect-loop'])
+
+    def test_chunked(self):
+        response, = self.fetch(['/chunked'])
+        self.assertEqual(response.body, b'<html><body>chunked</body></html>')
+
+    def test_max_size(self):
+        self.assertEqual(len(self.fetch(['/big'], max_size=4096)[0].body), 4096)
+        with self.assertRaises(FetchError):
+            self.fetch(['/big'], max_size=4095)
+        with self.assertRaises(FetchError):
+            self.fetch(['/chunked'], max_size=16)
+
+    def test_timeout(self):
+        with self.assertRaises(asyncio.TimeoutError):
+            self.fetch(['/slow'], timeout=0.2)
+
+    def test_not_found(self):
+        response, = self.fetch(['/missing.html'])
+        self.assertEqual(response.status, 404)
+        (url, groups, error), = FetchPipeline({'workers': 1}).run([self.base + '/missing.html'])
+        self.assertIsNone(groups)
+        self.assertEqual(error, 'FetchError: HTTP status 404')
+
+    def test_pipeline_reuse(self):
+        # concurrent fetches have to wait on the semaphores, which binds them to the loop
+        pipeline = FetchPipeline({'workers': 1, 'concurrency': 1, 'per_host_concurrency': 1})
+        for i in range(2):
+            results = pipeline.run([self.base + '/index.html'] * 3)
+            self.assertEqual([x[2] for x in results], [None] * 3)
+
+    def test_run_each(self):
+        done = []
+        FetchPipeline({'workers': 1}).run_each(
+            [self.base + '/slow', self.base + '/missing.html'],
+            lambda url, groups, error: done.append((url, error)))
+        self.assertEqual(done, [(self.base + '/missing.html', 'FetchError: HTTP status 404'),
+                                (self.base + '/slow', None)])
+
+    def test_idle_timeout(self):
+        async def run():
+            fetcher = AsyncFetcher({'idle_timeout': 0.0})
+            try:
+                await fetcher.fetch(self.base + '/index.html')
+                fetcher.evict_idle()
+                return await fetcher.fetch(self.base + '/index.html')
+            finally:
+                fetcher.close()
+        connections = self.server.connections
+        self.assertEqual(asyncio.run(run()).status, 200)
+        self.assertEqual(self.server.connections - connections, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
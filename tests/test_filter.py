@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import unittest
+
+from feed_detector.document import Document
+from feed_detector.filter   import BodyRemovalFilter
+
+
+RUN = 'Lorem ipsum dolor sit amet consectetur abc'
+
+
+def _story(runs, separator='<span class="footer">x</span>'):
+    return ('<html><body><div class="story">' + separator.join([RUN] * runs) +
+            '<p>short</p><a href="/x">body link</a></div>'
+            '<ul><li><a href="/1">one</a></li><li><a href="/2">two</a></li></ul>'
+            '</body></html>')
+
+
+class FastSkipTest(unittest.TestCase):
+
+    def filtered(self, html, **config):
+        doc = Document(html, url='http://example.com/')
+        BodyRemovalFilter(config).run(doc)
+        return [x.get('href') for x in doc.root.iter('a')]
+
+    def assertSameResult(self, html, **config):
+        self.assertEqual(self.filtered(html, fast_skip=True, **config),
+                         self.filtered(html, fast_skip=False, **config))
+
+    def test_dropped_leaves_join_texts(self):
+        # the <span>s are dropped as unlikely candidates, joining the three runs into one
+        # <p> that passes body_minimum_length although none of the runs does on its own
+        html = _story(3)
+        self.assertNotIn('/x', self.filtered(html, fast_skip=False, body_minimum_length=60))
+        self.assertSameResult(html, body_minimum_length=60)
+
+    def test_minimum_length(self):
+        for runs in (1, 2, 3, 5):
+            for separator in ('<span class="footer">x</span>', '<b>x</b>', '<br/>'):
+                for min_len in (0, 40, 60, 100, 200):
+                    self.assertSameResult(_story(runs, separator), body_minimum_length=min_len)
+
+
+if __name__ == '__main__':
+    unittest.main()
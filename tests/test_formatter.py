@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import io
+import json
+import unittest
+
+from feed_detector.formatter import CSV_COLUMNS, StreamFormatter
+
+
+RECORDS = [
+    {'rank': 1, 'score': 12, 'cbg_score': 10.5, 'path': 'html > body > ul.list', 'entries': [
+        {'title': 'Plain title', 'url': 'http://example.com/1', 'score': 2},
+        {'title': 'Comma, "quoted"', 'url': 'http://example.com/2', 'score': 1.5}]},
+    {'rank': 2, 'score': 3, 'cbg_score': 3, 'path': 'html > body > div', 'entries': [
+        {'title': 'Two\nlines', 'url': 'http://example.com/3', 'score': 1}]},
+]
+
+
+class StreamFormatterTest(unittest.TestCase):
+
+    def formatter(self, **config):
+        self.stream = io.StringIO()
+        return StreamFormatter(dict(config, stream=self.stream))
+
+    def test_jsonl(self):
+        formatter = self.formatter(output_format='jsonl', buffer_size=1)
+        self.assertEqual(formatter.write_records('http://example.com/', iter(RECORDS)), 2)
+        formatter.write_error('http://example.com/x', 'FetchError: HTTP status 404')
+        lines = [json.loads(x) for x in self.stream.getvalue().splitlines()]
+        self.assertEqual(lines[:2], [dict(x, page='http://example.com/') for x in RECORDS])
+        self.assertEqual(lines[2], {'page': 'http://example.com/x',
+                                    'error': 'FetchError: HTTP status 404'})
+
+    def test_csv(self):
+        formatter = self.formatter(output_format='csv')
+        formatter.write_records('http://example.com/', RECORDS)
+        formatter.write_records('http://example.com/b', RECORDS[1:])
+        self.assertEqual(self.stream.getvalue(), '\r\n'.join([
+            ','.join(CSV_COLUMNS),
+            'http://example.com/,1,12,10.5,html > body > ul.list,Plain title,'
+            'http://example.com/1,2',
+            'http://example.com/,1,12,10.5,html > body > ul.list,"Comma, ""quoted""",'
+            'http://example.com/2,1.5',
+            'http://example.com/,2,3,3,html > body > div,"Two\nlines",http://example.com/3,1',
+            'http://example.com/b,2,3,3,html > body > div,"Two\nlines",http://example.com/3,1',
+            '']))
+
+    def test_csv_without_header(self):
+        formatter = self.formatter(output_format='csv', csv_header=False)
+        formatter.write_records('http://example.com/', [])
+        self.assertEqual(self.stream.getvalue(), '')
+
+    def test_unknown_format(self):
+        self.assertRaises(ValueError, StreamFormatter, {'output_format': 'xml'})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+
+# Tests of the polling scheduler against a local http.server. Python 3 only.
+
+import asyncio
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from http.server  import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+from feed_detector.scheduler import PollScheduler
+from feed_detector.seen      import SeenStore
+
+
+def _list_page(items):
+    return ('<html><body><ul class="list">%s</ul></body></html>' %
+            ''.join(['<li><a href="/post/%d">Post number %d title</a></li>' % (i, i)
+                     for i in range(items)])).encode('utf-8')
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        body = _list_page(self.server.items)
+        etag = '"%d"' % self.server.items
+        if self.path == '/etag' and self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html')
+        self.send_header('Content-Length', str(len(body)))
+        if self.path == '/etag':
+            self.send_header('ETag', etag)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class PollSchedulerTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = _Server(('127.0.0.1', 0), _Handler)
+        cls.base = 'http://127.0.0.1:%d' % cls.server.server_address[1]
+        cls.thread = threading.Thread(target=cls.server.serve_forever)
+        cls.thread.daemon = True
+        cls.thread.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        self.server.items = 8
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def poll(self, scheduler, times):
+        """Polls every page `times` times; returns the results and the number of detections."""
+        detections = []
+        detect_body = scheduler.detect_body
+
+        async def counting_detect_body(body, url):
+            detections.append(url)
+            return await detect_body(body, url)
+        scheduler.detect_body = counting_detect_body
+
+        async def run():
+            scheduler.open()
+            try:
+                rv = []
+                for i in range(times):
+                    for page in scheduler.pages.values():
+                        page.next_poll = 0.0
+                    rv.append(await scheduler.poll_due())
+                return rv
+            finally:
+                scheduler.close()
+        return asyncio.run(run()), len(detections)
+
+    def test_not_modified(self):
+        scheduler = PollScheduler([self.base + '/etag'], {'workers': 1})
+        results, detections = self.poll(scheduler, 2)
+        self.assertEqual(len(results[0][0][1]), 8)
+        self.assertEqual(results[1][0][1:], ([], None))
+        self.assertEqual(detections, 1)
+        page = scheduler.pages[self.base + '/etag']
+        self.assertEqual(page.etag, '"8"')
+        self.assertEqual(page.interval, 3600.0 * 0.5 * 1.5)
+
+    def test_same_body(self):
+        scheduler = PollScheduler([self.base + '/'], {'workers': 1})
+        results, detections = self.poll(scheduler, 2)
+        self.assertEqual(len(results[0][0][1]), 8)
+        self.assertEqual(results[1][0][1:], ([], None))
+        self.assertEqual(detections, 1)
+
+    def test_new_entries(self):
+        scheduler = PollScheduler([self.base + '/'], {'workers': 1})
+        self.poll(scheduler, 1)
+        self.server.items = 10
+        results, detections = self.poll(scheduler, 1)
+        self.assertEqual(sorted([x['url'] for x in results[0][0][1]]),
+                         [self.base + '/post/8', self.base + '/post/9'])
+
+    def test_state_and_seen_store(self):
+        state = os.path.join(self.dir, 'state.json')
+        seen  = os.path.join(self.dir, 'seen')
+        store = SeenStore(seen)
+        scheduler = PollScheduler([self.base + '/etag'], {'workers': 1}, seen_store=store)
+        self.poll(scheduler, 1)
+        scheduler.save(state)
+        store.close()
+
+        # a restarted scheduler sends the saved etag, and the seen store keeps entries that
+        # were emitted before from being emitted again
+        self.server.items = 9
+        store = SeenStore(seen)
+        scheduler = PollScheduler(config={'workers': 1}, seen_store=store)
+        scheduler.load(state)
+        self.assertEqual(scheduler.pages[self.base + '/etag'].etag, '"8"')
+        results, detections = self.poll(scheduler, 1)
+        self.assertEqual([x['url'] for x in results[0][0][1]], [self.base + '/post/8'])
+        store.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
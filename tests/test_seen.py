@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+
+# Tests of the seen entry store. Python 3 only.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from feed_detector.seen import SeenStore
+
+
+class SeenStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir  = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'seen')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_sync_survives_a_crash(self):
+        store = SeenStore(self.path)
+        for h in (3, 1, 2):
+            store.add(h)
+        store.sync()
+        store.add(4)  # not synced, lost with the process
+        self.assertEqual(os.path.getsize(self.path), 0)
+        self.assertEqual(os.path.getsize(self.path + '.log'), 24)
+
+        # a partial write at the end of the log is ignored
+        with open(self.path + '.log', 'ab') as f:
+            f.write(b'\0\0\0')
+        store = SeenStore(self.path)
+        self.assertEqual(len(store), 3)
+        self.assertEqual([h in store for h in (1, 2, 3, 4)], [True, True, True, False])
+        self.assertFalse(store.add(2))
+        store.close()
+        self.assertFalse(os.path.exists(self.path + '.log'))
+        self.assertEqual(os.path.getsize(self.path), 24)
+        store = SeenStore(self.path)
+        self.assertEqual(len(store), 3)
+        store.close()
+
+    def test_merge(self):
+        store = SeenStore(self.path, flush_threshold=4)
+        self.assertTrue(store.add(10))
+        self.assertTrue(store.add(5))
+        self.assertFalse(store.add(10))
+        store.flush()
+        self.assertEqual(list(store._hashes), [5, 10])
+        for h in (7, 1, 12):
+            store.add(h)
+        self.assertEqual(list(store._hashes), [5, 10])
+        store.add(8)  # reaches flush_threshold
+        self.assertEqual(list(store._hashes), [1, 5, 7, 8, 10, 12])
+        self.assertEqual(os.path.getsize(self.path), 6 * 8)
+        self.assertEqual(len(store), 6)
+        store.close()
+
+    def test_persistence(self):
+        groups = [{'path': 'html > body > ul', 'entries': [
+            {'url': 'http://example.com/1', 'title': 'One'},
+            {'url': 'http://example.com/2', 'title': 'Two'}]}]
+        store = SeenStore(self.path)
+        self.assertEqual(store.filter_groups('http://example.com/', groups), groups)
+        store.close()
+
+        store = SeenStore(self.path)
+        self.assertEqual(len(store), 2)
+        self.assertEqual(store.filter_groups('http://example.com/', groups), [])
+        groups[0]['entries'].append({'url': 'http://example.com/3', 'title': 'Three'})
+        new, = store.filter_groups('http://example.com/', groups)
+        self.assertEqual([x['url'] for x in new['entries']], ['http://example.com/3'])
+        # the same entry on another page is new there
+        self.assertEqual(len(store.filter_groups('http://example.com/other', groups)), 1)
+        store.close()
+
+    def test_memory_store(self):
+        store = SeenStore()
+        for h in (3, 1, 2):
+            store.add(h)
+        store.sync()
+        store.flush()
+        self.assertEqual(list(store._hashes), [1, 2, 3])
+        self.assertIn(2, store)
+        self.assertNotIn(4, store)
+
+
+if __name__ == '__main__':
+    unittest.main()
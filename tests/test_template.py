@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import unittest
+
+from feed_detector.detector import Detector
+from feed_detector.document import Document
+from feed_detector.template import TemplateCache
+
+
+def _list_page(items):
+    return ('<html><body><ul class="list">%s</ul></body></html>' %
+            ''.join(['<li><a href="/post/%d">Post number %d title</a></li>' % (i, i)
+                     for i in range(items)]))
+
+
+class TemplateCacheTest(unittest.TestCase):
+
+    def detect(self, detector, items):
+        doc = Document(_list_page(items), url='http://example.com/list')
+        detector.prepare(doc)
+        return detector.run(doc)
+
+    def test_empty_result_is_not_a_template(self):
+        detector = Detector({'template_cache': True})
+        self.assertEqual(self.detect(detector, 4), [])
+        self.assertEqual(len(self.detect(detector, 8)), len(self.detect(Detector(), 8)))
+        self.assertEqual(detector.templates.snapshot()['hits'], 0)
+
+    def test_hit(self):
+        detector = Detector({'template_cache': True})
+        self.assertEqual(len(self.detect(detector, 8)), 1)
+        self.assertEqual(len(self.detect(detector, 9)), 1)
+        self.assertEqual(detector.templates.snapshot()['hits'], 1)
+
+    def test_empty_template_is_a_miss(self):
+        cache = TemplateCache()
+        cache.put('example.com', 0, [])
+        self.assertIsNone(cache.get('example.com', 0))
+        self.assertIsNone(cache.get('example.com', 1))
+        cache.put('example.com', 3, [[('html', 'body')]])
+        self.assertEqual(cache.get('example.com', 1), [[('html', 'body')]])
+        self.assertEqual(cache.snapshot()['misses'], 2)
+
+
+if __name__ == '__main__':
+    unittest.main()